@@ -0,0 +1,8 @@
+export interface ClassConfidence {
+  class: string;
+  confidence: number;
+}
+
+export interface InferenceResponse extends ClassConfidence {
+  top_k: ClassConfidence[];
+}
@@ -206,7 +206,8 @@ export class FolderUploadComponent implements OnInit{
       this.uploadService.classify(this.uploadedImage, this.servingId).subscribe({
         next: (res) => {
           this.labelVisible = true;
-          this.classificationLabel = res;
+          this.classificationLabel = 'This image most likely belongs to ' + res.class + ' with a '
+            + (100 * res.confidence).toFixed(2) + ' percent confidence.';
         },
         error: (err) => {
           this.printErrorMessage(err)
@@ -1,9 +1,10 @@
 import {Injectable} from '@angular/core';
 import {HttpClient} from "@angular/common/http";
 import {environment} from "../../environments/environment";
-import {Observable} from "rxjs";
+import {catchError, from, Observable, switchMap, throwError} from "rxjs";
 import {IdResponse} from "../dto/IdResponse";
 import {JobStatusResponse} from "../dto/JobStatusResponse";
+import {InferenceResponse} from "../dto/InferenceResponse";
 
 @Injectable({
   providedIn: 'root'
@@ -15,6 +16,8 @@ export class DataService {
   private training_url = this.global_url + '/training'
   private serving_url = this.global_url + '/serving'
   private inference_url = this.global_url + '/infer'
+  // crypto.subtle only hashes whole buffers, larger files are uploaded without checking for a duplicate first
+  private max_hashed_size = 128 * 1024 * 1024
 
 
   constructor(private http: HttpClient) {
@@ -24,7 +27,28 @@ export class DataService {
     console.log(this.data_url)
     const formData = new FormData();
     formData.append('file', file);
-    return this.http.post(this.data_url, formData);
+    if (!crypto.subtle || file.size > this.max_hashed_size) {
+      return this.http.post(this.data_url, formData);
+    }
+
+    // Send the hash first, the dataset is only uploaded if the service does not know it yet.
+    // If the file cannot be read into memory for hashing, it is uploaded as is
+    return from(this.sha256(file).catch(() => null)).pipe(
+      switchMap(hash => {
+        if (!hash) {
+          return this.http.post(this.data_url, formData);
+        }
+        const headers = {'X-Content-SHA256': hash};
+        return this.http.post(this.data_url, null, {headers}).pipe(
+          catchError(err => err.status === 404 ? this.http.post(this.data_url, formData, {headers}) : throwError(() => err))
+        );
+      })
+    );
+  }
+
+  private async sha256(file: File): Promise<string> {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
   }
 
   startTraining() {
@@ -47,10 +71,10 @@ export class DataService {
     return this.http.delete(this.serving_url);
   }
 
-  classify(image: File, id:number): Observable<any> {
+  classify(image: File, id:number): Observable<InferenceResponse> {
     const formData = new FormData();
     formData.append('file', image);
-    return this.http.post(this.serving_url+'/'+id+'/infer', formData, {responseType: 'text'}); //serving/id/infer
+    return this.http.post<InferenceResponse>(this.serving_url+'/'+id+'/infer', formData); //serving/id/infer
   }
 
 }
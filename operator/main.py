@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from kubernetes import client, config
 from kubernetes.client.exceptions import ApiException
 import os
@@ -6,6 +6,7 @@ import sys
 import logging
 import hashlib
 import uuid
+import functools
 
 # Define the required environment variables
 REQUIRED_ENV_VARS = [
@@ -17,6 +18,9 @@ REQUIRED_ENV_VARS = [
     "TLS_SECRET",
 ]
 
+# Number of tenants whose context is kept in memory
+TENANT_CACHE_SIZE = 1024
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -76,6 +80,44 @@ def _sha1(input_string):
     return sha256_hash
 
 
+class TenantContext:
+    """A tenant and the names of its Kubernetes resources, derived from its auth header."""
+
+    def __init__(self, auth_header):
+        self.auth_header = auth_header
+        self.hash = _sha1(auth_header)
+        self.namespace = self.hash
+        self.serving_name = "serving-" + self.hash
+        self.serving_path = "/serving/" + self.hash
+        self.training_prefix = "training-" + self.hash
+
+    @property
+    def labels(self):
+        # A new dict every time, callers add their own labels to it
+        return {"tenant": self.auth_header, "tenant-hash": self.hash}
+
+    def training_name(self, job_id):
+        return self.training_prefix + "-" + job_id
+
+
+# Contexts are immutable, so one instance per tenant is shared by all requests
+@functools.lru_cache(maxsize=TENANT_CACHE_SIZE)
+def get_tenant(auth_header):
+    return TenantContext(auth_header)
+
+
+@app.before_request
+def resolve_tenant():
+    # The auth header is resolved once per request, routes use g.tenant
+    if request.path == "/":
+        return
+
+    auth_header = request.headers.get("x-auth-request-user")
+    if not auth_header:
+        return jsonify({"error": "x-auth-request-user header is missing"}), 401
+    g.tenant = get_tenant(auth_header)
+
+
 @app.route("/", methods=["GET"])
 def alive():
     # Implement check logic here
@@ -85,32 +127,30 @@ def alive():
 # Define a route to create a training job
 @app.route("/training", methods=["POST"])
 def create_training_job():
-    # Fetch authorization-header
-    auth_header = request.headers.get("x-auth-request-user")
-    auth_header_hash = _sha1(auth_header)
+    tenant = g.tenant
     random_uuid = str(uuid.uuid4())[:10]
 
     # Check if the Job already exists and is in a running state
     try:
-        ensure_namespace_exists(auth_header_hash)
+        ensure_namespace_exists(tenant.namespace)
 
         # List all jobs in the namespace
-        jobs = batch_v1_api.list_namespaced_job(namespace=auth_header_hash)
+        jobs = batch_v1_api.list_namespaced_job(namespace=tenant.namespace)
 
         # Filter jobs based on the name
         filtered_jobs = [
             job.metadata.name
             for job in jobs.items
-            if job.metadata.name.startswith("training-" + auth_header_hash)
+            if job.metadata.name.startswith(tenant.training_prefix)
         ]
 
         for job_name in filtered_jobs:
             job = batch_v1_api.read_namespaced_job(
-                name=job_name, namespace=auth_header_hash
+                name=job_name, namespace=tenant.namespace
             )
             if job.status.active:
                 logging.info(
-                    f"Training job already exists and is in a running state for {auth_header_hash}"
+                    f"Training job already exists and is in a running state for {tenant.hash}"
                 )
                 return jsonify({"error": "Training job is running"}), 400
             # Delete the Job if it is in a failed state or has completed
@@ -132,18 +172,17 @@ def create_training_job():
         api_version="v1",
         kind="ConfigMap",
         metadata=client.V1ObjectMeta(
-            name="training-" + auth_header_hash + "-" + random_uuid,
+            name=tenant.training_name(random_uuid),
             labels={
                 "app": "training",
-                "tenant": auth_header,
-                "tenant-hash": auth_header_hash,
+                **tenant.labels,
                 "id": random_uuid,
             },
         ),
         data={
             "PERSISTENCE_SERVICE_URI": os.getenv("PERSISTENCE_SERVICE_URI"),
             "UUID": random_uuid,
-            "TENANT": auth_header,
+            "TENANT": tenant.auth_header,
         },
     )
 
@@ -152,11 +191,10 @@ def create_training_job():
         api_version="batch/v1",
         kind="Job",
         metadata=client.V1ObjectMeta(
-            name="training-" + auth_header_hash + "-" + random_uuid,
+            name=tenant.training_name(random_uuid),
             labels={
                 "app": "training",
-                "tenant": auth_header,
-                "tenant-hash": auth_header_hash,
+                **tenant.labels,
                 "id": random_uuid,
             },
         ),
@@ -166,7 +204,7 @@ def create_training_job():
                     restart_policy="Never",  # or "OnFailure"
                     containers=[
                         client.V1Container(
-                            name="training-" + auth_header_hash,
+                            name=tenant.training_prefix,
                             image=os.getenv("TRAINING_IMAGE"),
                             image_pull_policy="Always",
                             env=[
@@ -174,10 +212,7 @@ def create_training_job():
                                     name="PERSISTENCE_SERVICE_URI",
                                     value_from=client.V1EnvVarSource(
                                         config_map_key_ref=client.V1ConfigMapKeySelector(
-                                            name="training-"
-                                            + auth_header_hash
-                                            + "-"
-                                            + random_uuid,
+                                            name=tenant.training_name(random_uuid),
                                             key="PERSISTENCE_SERVICE_URI",
                                         )
                                     ),
@@ -186,10 +221,7 @@ def create_training_job():
                                     name="TENANT",
                                     value_from=client.V1EnvVarSource(
                                         config_map_key_ref=client.V1ConfigMapKeySelector(
-                                            name="training-"
-                                            + auth_header_hash
-                                            + "-"
-                                            + random_uuid,
+                                            name=tenant.training_name(random_uuid),
                                             key="TENANT",
                                         )
                                     ),
@@ -198,10 +230,7 @@ def create_training_job():
                                     name="UUID",
                                     value_from=client.V1EnvVarSource(
                                         config_map_key_ref=client.V1ConfigMapKeySelector(
-                                            name="training-"
-                                            + auth_header_hash
-                                            + "-"
-                                            + random_uuid,
+                                            name=tenant.training_name(random_uuid),
                                             key="UUID",
                                         )
                                     ),
@@ -218,12 +247,12 @@ def create_training_job():
 
     try:
         # Create the Job in the cluster
-        batch_v1_api.create_namespaced_job(namespace=auth_header_hash, body=job)
+        batch_v1_api.create_namespaced_job(namespace=tenant.namespace, body=job)
         # Create the ConfigMap in the cluster
         core_v1_api.create_namespaced_config_map(
-            namespace=auth_header_hash, body=config_map
+            namespace=tenant.namespace, body=config_map
         )
-        logging.info(f"Training job created successfully for {auth_header_hash}")
+        logging.info(f"Training job created successfully for {tenant.hash}")
         return jsonify({"id": random_uuid}), 202
     except Exception as e:
         logging.error(f"Unexpected error occurred: {str(e)}")
@@ -233,19 +262,17 @@ def create_training_job():
 # Define a route to get current states of all training jobs
 @app.route("/training", methods=["GET"])
 def get_training_jobs():
-    # Fetch authorization-header
-    auth_header = request.headers.get("x-auth-request-user")
-    auth_header_hash = _sha1(auth_header)
+    tenant = g.tenant
 
     try:
         # List all jobs in the namespace
-        jobs = batch_v1_api.list_namespaced_job(namespace=auth_header_hash)
+        jobs = batch_v1_api.list_namespaced_job(namespace=tenant.namespace)
 
         # Filter jobs based on the name
         filtered_jobs = [
             job
             for job in jobs.items
-            if job.metadata.name.startswith("training-" + auth_header_hash)
+            if job.metadata.name.startswith(tenant.training_prefix)
         ]
 
         job_states = {}
@@ -258,11 +285,10 @@ def get_training_jobs():
                 status = "Failed"
             else:
                 status = "Unknown"
-            job_states[
-                job.metadata.name.replace("training-" + auth_header_hash + "-", "")
-            ] = status
+            job_id = job.metadata.name.replace(tenant.training_prefix + "-", "")
+            job_states[job_id] = status
 
-        logging.info(f"Training job status for {auth_header_hash}: {job_states}")
+        logging.info(f"Training job status for {tenant.hash}: {job_states}")
 
         return jsonify(job_states), 200
     except ApiException as e:
@@ -279,16 +305,14 @@ def get_training_jobs():
 # Define a route to get current state of a training job
 @app.route("/training/<id>", methods=["GET"])
 def get_training_job(id):
-    # Fetch authorization-header
-    auth_header = request.headers.get("x-auth-request-user")
-    auth_header_hash = _sha1(auth_header)
+    tenant = g.tenant
 
     try:
         # Fetch the Job from the cluster
         job = batch_v1_api.read_namespaced_job(
-            name="training-" + auth_header_hash + "-" + id, namespace=auth_header_hash
+            name=tenant.training_name(id), namespace=tenant.namespace
         )
-        logging.info(f"Training job status for {auth_header_hash}: {job.status}")
+        logging.info(f"Training job status for {tenant.hash}: {job.status}")
 
         if job.status.active:
             status = "Active"
@@ -314,18 +338,16 @@ def get_training_job(id):
 # Define a route to create a serving deployment
 @app.route("/serving", methods=["POST"])
 def create_serving_deployment():
-    # Fetch authorization-header
-    auth_header = request.headers.get("x-auth-request-user")
-    auth_header_hash = _sha1(auth_header)
+    tenant = g.tenant
 
     # Check if the Deployment already exists
     try:
-        ensure_namespace_exists(auth_header_hash)
+        ensure_namespace_exists(tenant.namespace)
         deployment = apps_v1_api.read_namespaced_deployment(
-            name="serving-" + auth_header_hash, namespace=auth_header_hash
+            name=tenant.serving_name, namespace=tenant.namespace
         )
         if deployment:
-            logging.info(f"Serving deployment already exists for {auth_header_hash}")
+            logging.info(f"Serving deployment already exists for {tenant.hash}")
             return jsonify({"error": "Serving deployment already exists"}), 400
     except ApiException as e:
         logging.error(f"ApiException occurred: {str(e)}")
@@ -342,16 +364,15 @@ def create_serving_deployment():
         api_version="v1",
         kind="ConfigMap",
         metadata=client.V1ObjectMeta(
-            name="serving-" + auth_header_hash,
+            name=tenant.serving_name,
             labels={
                 "app": "serving",
-                "tenant": auth_header,
-                "tenant-hash": auth_header_hash,
+                **tenant.labels,
             },
         ),
         data={
             "PERSISTENCE_SERVICE_URI": os.getenv("PERSISTENCE_SERVICE_URI"),
-            "TENANT": auth_header,
+            "TENANT": tenant.auth_header,
         },
     )
 
@@ -360,11 +381,10 @@ def create_serving_deployment():
         api_version="apps/v1",
         kind="Deployment",
         metadata=client.V1ObjectMeta(
-            name="serving-" + auth_header_hash,
+            name=tenant.serving_name,
             labels={
                 "app": "serving",
-                "tenant": auth_header,
-                "tenant-hash": auth_header_hash,
+                **tenant.labels,
             },
         ),
         spec=client.V1DeploymentSpec(
@@ -372,22 +392,20 @@ def create_serving_deployment():
             selector=client.V1LabelSelector(
                 match_labels={
                     "app": "serving",
-                    "tenant": auth_header,
-                    "tenant-hash": auth_header_hash,
+                    **tenant.labels,
                 }
             ),
             template=client.V1PodTemplateSpec(
                 metadata=client.V1ObjectMeta(
                     labels={
                         "app": "serving",
-                        "tenant": auth_header,
-                        "tenant-hash": auth_header_hash,
+                        **tenant.labels,
                     }
                 ),
                 spec=client.V1PodSpec(
                     containers=[
                         client.V1Container(
-                            name="serving-" + auth_header_hash,
+                            name=tenant.serving_name,
                             image=os.getenv("SERVING_IMAGE"),
                             image_pull_policy="Always",
                             ports=[
@@ -400,7 +418,7 @@ def create_serving_deployment():
                                     name="PERSISTENCE_SERVICE_URI",
                                     value_from=client.V1EnvVarSource(
                                         config_map_key_ref=client.V1ConfigMapKeySelector(
-                                            name="serving-" + auth_header_hash,
+                                            name=tenant.serving_name,
                                             key="PERSISTENCE_SERVICE_URI",
                                         )
                                     ),
@@ -409,14 +427,32 @@ def create_serving_deployment():
                                     name="TENANT",
                                     value_from=client.V1EnvVarSource(
                                         config_map_key_ref=client.V1ConfigMapKeySelector(
-                                            name="serving-" + auth_header_hash,
+                                            name=tenant.serving_name,
                                             key="TENANT",
                                         )
                                     ),
                                 ),
+                                client.V1EnvVar(
+                                    name="MODEL_CACHE_DIR",
+                                    value="/app/model-cache",
+                                ),
+                            ],
+                            volume_mounts=[
+                                client.V1VolumeMount(
+                                    name="model-cache",
+                                    mount_path="/app/model-cache",
+                                )
                             ],
                         )
-                    ]
+                    ],
+                    # Survives container restarts, so the model is not re-extracted.
+                    # Writable by the non-root serving image, unlike a hostPath
+                    volumes=[
+                        client.V1Volume(
+                            name="model-cache",
+                            empty_dir=client.V1EmptyDirVolumeSource(),
+                        )
+                    ],
                 ),
             ),
         ),
@@ -427,18 +463,16 @@ def create_serving_deployment():
         api_version="v1",
         kind="Service",
         metadata=client.V1ObjectMeta(
-            name="serving-" + auth_header_hash,
+            name=tenant.serving_name,
             labels={
                 "app": "serving",
-                "tenant": auth_header,
-                "tenant-hash": auth_header_hash,
+                **tenant.labels,
             },
         ),
         spec=client.V1ServiceSpec(
             selector={
                 "app": "serving",
-                "tenant": auth_header,
-                "tenant-hash": auth_header_hash,
+                **tenant.labels,
             },
             ports=[
                 client.V1ServicePort(
@@ -498,13 +532,17 @@ def create_serving_deployment():
         "apiVersion": "networking.k8s.io/v1",
         "kind": "Ingress",
         "metadata": {
-            "name": "serving-" + auth_header_hash,
+            "name": tenant.serving_name,
             "labels": {
                 "app": "serving",
-                "tenant": auth_header,
-                "tenant-hash": auth_header_hash,
+                **tenant.labels,
+            },
+            # /serving/<hash> and /serving/<hash>/infer reach /infer,
+            # /serving/<hash>/batch and /serving/<hash>/infer/batch reach /infer/batch
+            "annotations": {
+                "nginx.ingress.kubernetes.io/use-regex": "true",
+                "nginx.ingress.kubernetes.io/rewrite-target": "/infer$2",
             },
-            "annotations": {"nginx.ingress.kubernetes.io/rewrite-target": "/infer"},
         },
         "spec": {
             "ingressClassName": "nginx-static",
@@ -514,11 +552,11 @@ def create_serving_deployment():
                     "http": {
                         "paths": [
                             {
-                                "path": "/serving/" + auth_header_hash,
-                                "pathType": "Prefix",
+                                "path": tenant.serving_path + "(/infer)?(/batch)?",
+                                "pathType": "ImplementationSpecific",
                                 "backend": {
                                     "service": {
-                                        "name": "serving-" + auth_header_hash,
+                                        "name": tenant.serving_name,
                                         "port": {"number": 80},
                                     }
                                 },
@@ -536,34 +574,31 @@ def create_serving_deployment():
     try:
         # Create the ConfigMap in the cluster
         core_v1_api.create_namespaced_config_map(
-            namespace=auth_header_hash, body=config_map
+            namespace=tenant.namespace, body=config_map
         )
-        logging.info(f"Serving ConfigMap created successfully for {auth_header_hash}")
+        logging.info(f"Serving ConfigMap created successfully for {tenant.hash}")
 
         # Create the Deployment in the cluster
         apps_v1_api.create_namespaced_deployment(
-            namespace=auth_header_hash, body=deployment
+            namespace=tenant.namespace, body=deployment
         )
-        logging.info(f"Serving deployment created successfully for {auth_header_hash}")
+        logging.info(f"Serving deployment created successfully for {tenant.hash}")
 
         # Create the Service in the cluster
-        core_v1_api.create_namespaced_service(namespace=auth_header_hash, body=service)
-        logging.info(f"Serving service created successfully for {auth_header_hash}")
+        core_v1_api.create_namespaced_service(namespace=tenant.namespace, body=service)
+        logging.info(f"Serving service created successfully for {tenant.hash}")
 
         # Create the Ingress in the cluster
         networking_v1_api.create_namespaced_ingress(
-            namespace=auth_header_hash, body=ingress
+            namespace=tenant.namespace, body=ingress
         )
-        logging.info(f"Serving ingress created successfully for {auth_header_hash}")
+        logging.info(f"Serving ingress created successfully for {tenant.hash}")
 
         return (
             jsonify(
                 {
-                    "url": "https://"
-                    + os.getenv("DOMAIN")
-                    + "/serving/"
-                    + auth_header_hash,
-                    "id": auth_header_hash,
+                    "url": "https://" + os.getenv("DOMAIN") + tenant.serving_path,
+                    "id": tenant.hash,
                 }
             ),
             201,
@@ -576,28 +611,26 @@ def create_serving_deployment():
 # Define a route to get the status of a serving deployment
 @app.route("/serving", methods=["GET"])
 def get_serving_deployment():
-    # Fetch authorization-header
-    auth_header = request.headers.get("x-auth-request-user")
-    auth_header_hash = _sha1(auth_header)
+    tenant = g.tenant
 
     try:
         # Fetch the Deployment from the cluster
         deployment = apps_v1_api.read_namespaced_deployment(
-            name="serving-" + auth_header_hash, namespace=auth_header_hash
+            name=tenant.serving_name, namespace=tenant.namespace
         )
 
         # Fetch the Service from the cluster
         service = core_v1_api.read_namespaced_service(
-            name="serving-" + auth_header_hash, namespace=auth_header_hash
+            name=tenant.serving_name, namespace=tenant.namespace
         )
 
         # Fetch the Ingress from the cluster
         ingress = networking_v1_api.read_namespaced_ingress(
-            name="serving-" + auth_header_hash, namespace=auth_header_hash
+            name=tenant.serving_name, namespace=tenant.namespace
         )
 
         logging.info(
-            f"Serving deployment status for {auth_header_hash}: {deployment.status}"
+            f"Serving deployment status for {tenant.hash}: {deployment.status}"
         )
         return (
             jsonify(
@@ -605,11 +638,8 @@ def get_serving_deployment():
                     "available": (
                         True if deployment.status.available_replicas else False
                     ),
-                    "url": "https://"
-                    + os.getenv("DOMAIN")
-                    + "/serving/"
-                    + auth_header_hash,
-                    "id": auth_header_hash,
+                    "url": "https://" + os.getenv("DOMAIN") + tenant.serving_path,
+                    "id": tenant.hash,
                 }
             ),
             200,
@@ -628,29 +658,27 @@ def get_serving_deployment():
 # Define a route to remove a serving deployment
 @app.route("/serving", methods=["DELETE"])
 def delete_serving_deployment():
-    # Fetch authorization-header
-    auth_header = request.headers.get("x-auth-request-user")
-    auth_header_hash = _sha1(auth_header)
+    tenant = g.tenant
 
     try:
         # Delete the Deployment from the cluster
         apps_v1_api.delete_namespaced_deployment(
-            name="serving-" + auth_header_hash, namespace=auth_header_hash
+            name=tenant.serving_name, namespace=tenant.namespace
         )
-        logging.info(f"Serving deployment deleted successfully for {auth_header_hash}")
+        logging.info(f"Serving deployment deleted successfully for {tenant.hash}")
         # Delete the Service from the cluster
         core_v1_api.delete_namespaced_service(
-            name="serving-" + auth_header_hash, namespace=auth_header_hash
+            name=tenant.serving_name, namespace=tenant.namespace
         )
-        logging.info(f"Serving service deleted successfully for {auth_header_hash}")
+        logging.info(f"Serving service deleted successfully for {tenant.hash}")
         # Delete the Ingress from the cluster
         networking_v1_api.delete_namespaced_ingress(
-            name="serving-" + auth_header_hash, namespace=auth_header_hash
+            name=tenant.serving_name, namespace=tenant.namespace
         )
-        logging.info(f"Serving ingress deleted successfully for {auth_header_hash}")
+        logging.info(f"Serving ingress deleted successfully for {tenant.hash}")
         # Delete the ConfigMap from the cluster
         core_v1_api.delete_namespaced_config_map(
-            name="serving-" + auth_header_hash, namespace=auth_header_hash
+            name=tenant.serving_name, namespace=tenant.namespace
         )
 
         return jsonify(), 200
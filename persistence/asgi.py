@@ -0,0 +1,791 @@
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import tempfile
+import contextlib
+import uuid
+import aiohttp
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.middleware import Middleware
+from starlette.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.routing import Route
+from werkzeug.http import http_date, parse_range_header
+
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.storage.blob import BlobBlock, ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
+from dotenv import load_dotenv
+
+# Same API as main.py, but on asyncio: a transfer waits on the network without
+# holding a worker, so one process serves hundreds of concurrent transfers
+try:
+    from .main import (
+        DOWNLOAD_CHUNK_SIZE,
+        BlobDownload,
+        BlobExists,
+        BlobNotFound,
+        BlobNotModified,
+        InvalidBlockList,
+        LocalFileBackend,
+        RangeNotSatisfiable,
+        _block_id,
+        _is_sha256,
+        _is_upload_id,
+        _is_version,
+        _latest_blob,
+        _version_blob,
+        get_tenant,
+    )
+except ImportError:
+    from main import (
+        DOWNLOAD_CHUNK_SIZE,
+        BlobDownload,
+        BlobExists,
+        BlobNotFound,
+        BlobNotModified,
+        InvalidBlockList,
+        LocalFileBackend,
+        RangeNotSatisfiable,
+        _block_id,
+        _is_sha256,
+        _is_upload_id,
+        _is_version,
+        _latest_blob,
+        _version_blob,
+        get_tenant,
+    )
+
+
+# ---------------------------------------------------------------------
+# --------------------------storage backends---------------------------
+# ---------------------------------------------------------------------
+
+
+class AsyncAzureBlobBackend:
+    """The StorageBackend operations of main.AzureBlobBackend on the async Azure SDK.
+
+    Uploads take async iterables of bytes, downloads return a BlobDownload whose
+    chunks are an async iterator.
+    """
+
+    def __init__(
+        self, connection_string, container_cache_ttl, pool_size, upload_concurrency
+    ):
+        self.container_cache_ttl = container_cache_ttl
+        self.upload_concurrency = upload_concurrency
+
+        # container name -> time until which it is known to exist
+        self.known_containers = {}
+
+        # One client and connection pool per process, created inside the event loop
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size)
+        )
+        transport = AioHttpTransport(session=self.session, session_owner=False)
+        self.blob_service_client = BlobServiceClient.from_connection_string(
+            connection_string,
+            transport=transport,
+            max_single_get_size=DOWNLOAD_CHUNK_SIZE,
+            max_chunk_get_size=DOWNLOAD_CHUNK_SIZE,
+        )
+
+    async def close(self):
+        await self.blob_service_client.close()
+        await self.session.close()
+
+    async def ensure_container(self, container_client):
+        container_name = container_client.container_name
+        if self.known_containers.get(container_name, 0) > time.monotonic():
+            return
+
+        try:
+            await container_client.create_container()
+            print(f"Container '{container_name}' created.")
+        except ResourceExistsError:
+            pass
+        self.known_containers[container_name] = (
+            time.monotonic() + self.container_cache_ttl
+        )
+
+    async def get_blob_client(self, user, blob_name):
+        container_client = self.blob_service_client.get_container_client(user)
+        await self.ensure_container(container_client)
+        return container_client.get_blob_client(blob_name)
+
+    async def upload(self, user, blob_name, data, content_type, overwrite=True):
+        blob_client = await self.get_blob_client(user, blob_name)
+        content_settings = ContentSettings(content_type=content_type)
+        try:
+            await blob_client.upload_blob(
+                data,
+                content_settings=content_settings,
+                overwrite=overwrite,
+                max_concurrency=self.upload_concurrency,
+            )
+        except ResourceExistsError:
+            raise BlobExists(blob_name)
+
+    async def download(
+        self, user, blob_name, offset=None, length=None, if_none_match=None
+    ):
+        blob_client = await self.get_blob_client(user, blob_name)
+
+        conditions = {}
+        if if_none_match:
+            conditions = {
+                "etag": if_none_match,
+                "match_condition": MatchConditions.IfModified,
+            }
+
+        try:
+            downloader = await blob_client.download_blob(
+                offset=offset, length=length, **conditions
+            )
+        except ResourceNotFoundError:
+            raise BlobNotFound(blob_name)
+        except HttpResponseError as e:
+            if e.status_code == 304:
+                raise BlobNotModified(
+                    blob_name,
+                    e.response.headers.get("ETag") if e.response is not None else None,
+                )
+            if e.status_code == 416:
+                raise RangeNotSatisfiable(blob_name)
+            raise
+
+        properties = downloader.properties
+        content_settings = properties.content_settings
+        total_size = int(properties.content_range.rsplit("/", 1)[1])
+        return BlobDownload(
+            downloader.chunks(),
+            downloader.size,
+            total_size,
+            properties.etag,
+            properties.last_modified,
+            content_settings.content_type,
+            content_md5=content_settings.content_md5,
+            offset=offset,
+        )
+
+    async def exists(self, user, blob_name):
+        blob_client = await self.get_blob_client(user, blob_name)
+        return await blob_client.exists()
+
+    async def stage_block(self, user, blob_name, block_id, data, length):
+        blob_client = await self.get_blob_client(user, blob_name)
+        await blob_client.stage_block(block_id, data, length=length)
+
+    async def list_staged_blocks(self, user, blob_name):
+        blob_client = await self.get_blob_client(user, blob_name)
+        try:
+            _, uncommitted = await blob_client.get_block_list("uncommitted")
+        except ResourceNotFoundError:
+            return []
+        return [block.id for block in uncommitted]
+
+    async def commit_blocks(
+        self, user, blob_name, block_ids, content_type, overwrite=True
+    ):
+        blob_client = await self.get_blob_client(user, blob_name)
+        block_list = [BlobBlock(block_id) for block_id in block_ids]
+        content_settings = ContentSettings(content_type=content_type)
+
+        conditions = {}
+        if not overwrite:
+            conditions = {"etag": "*", "match_condition": MatchConditions.IfMissing}
+        try:
+            await blob_client.commit_block_list(
+                block_list, content_settings=content_settings, **conditions
+            )
+        except (ResourceExistsError, ResourceModifiedError):
+            raise BlobExists(blob_name)
+        except HttpResponseError as e:
+            if e.error_code == "InvalidBlockList":
+                raise InvalidBlockList(blob_name)
+            raise
+
+    async def list(self, user, prefix):
+        container_client = self.blob_service_client.get_container_client(user)
+        try:
+            return [
+                {
+                    "name": blob.name,
+                    "size": blob.size,
+                    "last_modified": blob.last_modified,
+                }
+                async for blob in container_client.list_blobs(name_starts_with=prefix)
+            ]
+        except ResourceNotFoundError:
+            return []
+
+
+class ThreadedBackend:
+    """Runs a blocking StorageBackend, i.e. the local filesystem backend, in the thread pool."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def close(self):
+        pass
+
+    async def upload(self, user, blob_name, data, content_type, overwrite=True):
+        with await _spool(data) as spool:
+            await run_in_threadpool(
+                self.backend.upload, user, blob_name, spool, content_type, overwrite
+            )
+
+    async def download(
+        self, user, blob_name, offset=None, length=None, if_none_match=None
+    ):
+        download = await run_in_threadpool(
+            self.backend.download, user, blob_name, offset, length, if_none_match
+        )
+        download.chunks = _ThreadedChunks(download.chunks)
+        return download
+
+    async def stage_block(self, user, blob_name, block_id, data, length):
+        with await _spool(data) as spool:
+            await run_in_threadpool(
+                self.backend.stage_block, user, blob_name, block_id, spool, length
+            )
+
+    async def exists(self, user, blob_name):
+        return await run_in_threadpool(self.backend.exists, user, blob_name)
+
+    async def list_staged_blocks(self, user, blob_name):
+        return await run_in_threadpool(self.backend.list_staged_blocks, user, blob_name)
+
+    async def commit_blocks(
+        self, user, blob_name, block_ids, content_type, overwrite=True
+    ):
+        await run_in_threadpool(
+            self.backend.commit_blocks,
+            user,
+            blob_name,
+            block_ids,
+            content_type,
+            overwrite,
+        )
+
+    async def list(self, user, prefix):
+        return await run_in_threadpool(self.backend.list, user, prefix)
+
+
+class _ThreadedChunks:
+    # Async iterator over the blocking chunk iterator of a local download
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await run_in_threadpool(next, self.chunks, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self):
+        await run_in_threadpool(self.chunks.close)
+
+
+async def _spool(chunks):
+    # Buffers an async body for a blocking backend, on disk once it gets large
+    spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_CHUNK_SIZE)
+    async for chunk in chunks:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+async def _iter_upload(upload):
+    while True:
+        chunk = await upload.read(DOWNLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+storage = None
+
+
+def load_env():
+    load_dotenv()
+    global storage
+    backend = os.getenv("STORAGE_BACKEND", "azure")
+    if backend == "local":
+        storage = ThreadedBackend(
+            LocalFileBackend(os.getenv("LOCAL_STORAGE_PATH", "./storage"))
+        )
+    elif backend == "azure":
+        storage = AsyncAzureBlobBackend(
+            os.getenv("CONNECTION_STRING"),
+            container_cache_ttl=float(os.getenv("CONTAINER_CACHE_TTL", "300")),
+            pool_size=int(os.getenv("BLOB_POOL_SIZE", "32")),
+            upload_concurrency=int(os.getenv("UPLOAD_CONCURRENCY", "4")),
+        )
+    else:
+        sys.exit(f"Error: Unknown STORAGE_BACKEND '{backend}'")
+
+
+async def get_latest_version(user, endpoint):
+    try:
+        download = await storage.download(user, _latest_blob(endpoint))
+    except BlobNotFound:
+        return None
+    return json.loads(b"".join([chunk async for chunk in download.chunks]))["version"]
+
+
+async def set_latest_version(user, endpoint, version):
+    await storage.upload(
+        user,
+        _latest_blob(endpoint),
+        _iter_bytes(json.dumps({"version": version}).encode()),
+        "application/json",
+    )
+
+
+async def _iter_bytes(data):
+    yield data
+
+
+async def list_versions(user, endpoint):
+    prefix = _version_blob(endpoint, "")
+    blobs = sorted(
+        await storage.list(user, prefix), key=lambda blob: blob["last_modified"]
+    )
+    return [
+        {
+            "version": blob["name"][len(prefix) :],
+            "size": blob["size"],
+            "last_modified": http_date(blob["last_modified"]),
+        }
+        for blob in blobs
+    ]
+
+
+# ---------------------------------------------------------------------
+# -------------generic upload/download functions-----------------------
+# ---------------------------------------------------------------------
+
+
+async def _upload_to_blob_storage(request, endpoint):
+    form = await request.form()
+    file = form.get("file")
+    if file is None or isinstance(file, str):
+        print("No file found in request", file=sys.stderr)
+        return JSONResponse({"error": "No file provided"}, 400)
+
+    if file.filename == "":
+        print("File is empty", file=sys.stderr)
+        return JSONResponse({"error": "File is empty"}, 400)
+
+    version = (
+        form.get("version") or request.query_params.get("version") or str(uuid.uuid4())
+    )
+    if not _is_version(version):
+        return JSONResponse({"error": "Invalid version"}, 400)
+
+    user = request.state.tenant.container
+    try:
+        await storage.upload(
+            user,
+            _version_blob(endpoint, version),
+            _iter_upload(file),
+            file.content_type,
+            overwrite=False,
+        )
+        await set_latest_version(user, endpoint, version)
+        return JSONResponse({"status": "OK", "version": version}, 200)
+    except BlobExists as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Version already exists"}, 409)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Data upload failed"}, 500)
+    finally:
+        await form.close()
+
+
+async def _upload_dataset(request, endpoint):
+    # Content addressed like main._upload_dataset, the spooled upload is hashed before it is stored
+    claimed_hash = request.headers.get("x-content-sha256", "").lower() or None
+    if claimed_hash is not None and not _is_sha256(claimed_hash):
+        return JSONResponse({"error": "Invalid content hash"}, 400)
+
+    form = await request.form()
+    file = form.get("file")
+    if isinstance(file, str):
+        file = None
+    if file is None and claimed_hash is None:
+        print("No file found in request", file=sys.stderr)
+        return JSONResponse({"error": "No file provided"}, 400)
+    if file is not None and file.filename == "":
+        print("File is empty", file=sys.stderr)
+        return JSONResponse({"error": "File is empty"}, 400)
+
+    user = request.state.tenant.container
+    try:
+        if file is None:
+            if not await storage.exists(user, _version_blob(endpoint, claimed_hash)):
+                return JSONResponse({"error": "Unknown content, upload the file"}, 404)
+            await set_latest_version(user, endpoint, claimed_hash)
+            return JSONResponse(
+                {"status": "OK", "version": claimed_hash, "deduplicated": True}, 200
+            )
+
+        sha256 = hashlib.sha256()
+        async for chunk in _iter_upload(file):
+            sha256.update(chunk)
+        await file.seek(0)
+        content_hash = sha256.hexdigest()
+        if claimed_hash is not None and claimed_hash != content_hash:
+            return JSONResponse({"error": "Content hash mismatch"}, 400)
+
+        blob_name = _version_blob(endpoint, content_hash)
+        deduplicated = await storage.exists(user, blob_name)
+        if not deduplicated:
+            try:
+                await storage.upload(
+                    user,
+                    blob_name,
+                    _iter_upload(file),
+                    file.content_type,
+                    overwrite=False,
+                )
+            except BlobExists:
+                deduplicated = True
+        await set_latest_version(user, endpoint, content_hash)
+        return JSONResponse(
+            {"status": "OK", "version": content_hash, "deduplicated": deduplicated}, 200
+        )
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Data upload failed"}, 500)
+    finally:
+        await form.close()
+
+
+def _requested_range(request):
+    # Same rules as main._requested_range: only "bytes=<start>-[<end>]" is served partially
+    requested = parse_range_header(request.headers.get("range"))
+    if requested is None or request.headers.get("if-range"):
+        return None, None
+    if requested.units != "bytes" or len(requested.ranges) != 1:
+        return None, None
+
+    start, stop = requested.ranges[0]
+    if start < 0:
+        return None, None
+    return start, (stop - start if stop is not None else None)
+
+
+async def _download_from_blob_storage(request, blob_name, headers):
+    offset, length = _requested_range(request)
+    if_none_match = request.headers.get("if-none-match")
+    try:
+        user = request.state.tenant.container
+        download = await storage.download(
+            user, blob_name, offset, length, if_none_match
+        )
+    except BlobNotFound:
+        print(f"Blob '{blob_name}' does not exist.", file=sys.stderr)
+        return JSONResponse({"error": "Data not found"}, 404)
+    except BlobNotModified as e:
+        # The stored blob's ETag, a list sent by the client must not be echoed
+        return Response(
+            status_code=304, headers={**({"ETag": e.etag} if e.etag else {}), **headers}
+        )
+    except RangeNotSatisfiable:
+        return JSONResponse({"error": "Requested range not satisfiable"}, 416)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Data not found"}, 404)
+
+    headers = {
+        **headers,
+        "Content-Length": str(download.size),
+        "Content-Disposition": "attachment; filename=data",
+        "Accept-Ranges": "bytes",
+        "ETag": download.etag,
+        "Last-Modified": http_date(download.last_modified),
+    }
+
+    status = 200
+    if offset is not None:
+        status = 206
+        headers["Content-Range"] = download.content_range
+    elif download.content_md5:
+        headers["Content-MD5"] = base64.b64encode(download.content_md5).decode()
+
+    # Whole local files are sent by the server directly where it supports it
+    if download.path is not None and "range" not in request.headers:
+        await download.chunks.aclose()
+        return FileResponse(
+            download.path,
+            status_code=status,
+            headers=headers,
+            media_type=download.content_type,
+        )
+    return StreamingResponse(
+        download.chunks,
+        status_code=status,
+        headers=headers,
+        media_type=download.content_type,
+    )
+
+
+async def _download_version(request, endpoint):
+    user = request.state.tenant.container
+    version = request.query_params.get("version")
+    headers = {}
+    if version is not None:
+        if not _is_version(version):
+            return JSONResponse({"error": "Invalid version"}, 400)
+        headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        try:
+            version = await get_latest_version(user, endpoint)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            return JSONResponse({"error": "Data not found"}, 404)
+
+    if version is None:
+        return await _download_from_blob_storage(request, endpoint, headers)
+    headers["X-Artifact-Version"] = version
+    return await _download_from_blob_storage(
+        request, _version_blob(endpoint, version), headers
+    )
+
+
+async def _list_versions(request, endpoint):
+    user = request.state.tenant.container
+    try:
+        return JSONResponse(
+            {
+                "latest": await get_latest_version(user, endpoint),
+                "versions": await list_versions(user, endpoint),
+            },
+            200,
+        )
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Listing versions failed"}, 500)
+
+
+# ---------------------------------------------------------------------
+# -----------------------chunked upload functions----------------------
+# ---------------------------------------------------------------------
+
+
+async def _start_chunked_upload(request, endpoint):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    version = (body if isinstance(body, dict) else {}).get("version") or str(
+        uuid.uuid4()
+    )
+    if not _is_upload_id(version, endpoint):
+        return JSONResponse({"error": "Invalid version"}, 400)
+    return JSONResponse({"upload_id": version, "version": version}, 200)
+
+
+async def _put_block(request, endpoint):
+    upload_id = request.path_params["upload_id"]
+    index = request.path_params["index"]
+    if not _is_upload_id(upload_id, endpoint):
+        return JSONResponse({"error": "Invalid upload id"}, 400)
+    length = int(request.headers.get("content-length") or 0)
+    if not length:
+        return JSONResponse({"error": "Block is empty"}, 400)
+
+    user = request.state.tenant.container
+    try:
+        # The block is passed on as it arrives, it is never held in memory as a whole
+        await storage.stage_block(
+            user,
+            _version_blob(endpoint, upload_id),
+            _block_id(upload_id, index),
+            request.stream(),
+            length,
+        )
+        return JSONResponse({"status": "OK"}, 200)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Block upload failed"}, 500)
+
+
+async def _get_chunked_upload(request, endpoint):
+    upload_id = request.path_params["upload_id"]
+    if not _is_upload_id(upload_id, endpoint):
+        return JSONResponse({"error": "Invalid upload id"}, 400)
+
+    user = request.state.tenant.container
+    prefix = f"{upload_id}-"
+    try:
+        block_ids = await storage.list_staged_blocks(
+            user, _version_blob(endpoint, upload_id)
+        )
+        blocks = sorted(
+            int(block_id[len(prefix) :])
+            for block_id in block_ids
+            if block_id.startswith(prefix)
+        )
+        return JSONResponse({"upload_id": upload_id, "blocks": blocks}, 200)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Listing blocks failed"}, 500)
+
+
+async def _commit_chunked_upload(request, endpoint):
+    upload_id = request.path_params["upload_id"]
+    if not _is_upload_id(upload_id, endpoint):
+        return JSONResponse({"error": "Invalid upload id"}, 400)
+
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    body = body if isinstance(body, dict) else {}
+    block_count = body.get("blocks")
+    if not isinstance(block_count, int) or block_count < 1:
+        return JSONResponse({"error": "Number of blocks missing"}, 400)
+    content_type = body.get("content_type", "application/octet-stream")
+
+    user = request.state.tenant.container
+    block_ids = [_block_id(upload_id, index) for index in range(block_count)]
+    try:
+        await storage.commit_blocks(
+            user,
+            _version_blob(endpoint, upload_id),
+            block_ids,
+            content_type,
+            overwrite=False,
+        )
+        await set_latest_version(user, endpoint, upload_id)
+        return JSONResponse({"status": "OK", "version": upload_id}, 200)
+    except InvalidBlockList as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Not all blocks have been uploaded"}, 400)
+    except BlobExists as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Version already exists"}, 409)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return JSONResponse({"error": "Data upload failed"}, 500)
+
+
+# ---------------------------------------------------------------------
+# ---------------------------------API---------------------------------
+# ---------------------------------------------------------------------
+
+
+def _endpoint_routes(endpoint, upload_handler):
+    # /data, /model and /cache share their handlers, like the route functions in main.py
+    def bind(handler):
+        async def route(request):
+            return await handler(request, endpoint)
+
+        return route
+
+    return [
+        Route(f"/{endpoint}", bind(upload_handler), methods=["POST"]),
+        Route(f"/{endpoint}", bind(_download_version), methods=["GET"]),
+        Route(f"/{endpoint}/versions", bind(_list_versions), methods=["GET"]),
+        Route(f"/{endpoint}/uploads", bind(_start_chunked_upload), methods=["POST"]),
+        Route(
+            f"/{endpoint}/uploads/{{upload_id}}",
+            bind(_get_chunked_upload),
+            methods=["GET"],
+        ),
+        Route(
+            f"/{endpoint}/uploads/{{upload_id}}/blocks/{{index:int}}",
+            bind(_put_block),
+            methods=["PUT"],
+        ),
+        Route(
+            f"/{endpoint}/uploads/{{upload_id}}/commit",
+            bind(_commit_chunked_upload),
+            methods=["POST"],
+        ),
+    ]
+
+
+async def hello_world(request):
+    return PlainTextResponse("Hello, World!")
+
+
+async def healthcheck(request):
+    return JSONResponse({"status": "OK"}, 200)
+
+
+class EnforceAuthHeader:
+    """Rejects requests without the x-auth-request-user header.
+
+    A pure ASGI middleware, unlike BaseHTTPMiddleware it passes the
+    messages of streamed up- and downloads through without an extra task.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in ("/", "/healthcheck"):
+            await self.app(scope, receive, send)
+            return
+
+        auth_header = Headers(scope=scope).get("x-auth-request-user")
+        if not auth_header:
+            response = JSONResponse(
+                {"error": "x-auth-request-user header is missing"}, 401
+            )
+            await response(scope, receive, send)
+            return
+
+        # Shares the tenant cache of main.py, the handlers use request.state.tenant
+        scope.setdefault("state", {})["tenant"] = get_tenant(auth_header)
+        await self.app(scope, receive, send)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # The aiohttp session has to be created inside the event loop
+    load_env()
+    yield
+    await storage.close()
+
+
+app = Starlette(
+    routes=[
+        *_endpoint_routes("data", _upload_dataset),
+        *_endpoint_routes("model", _upload_to_blob_storage),
+        *_endpoint_routes("cache", _upload_to_blob_storage),
+        Route("/", hello_world),
+        Route("/healthcheck", healthcheck),
+    ],
+    middleware=[Middleware(EnforceAuthHeader)],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=5000)
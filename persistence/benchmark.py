@@ -0,0 +1,429 @@
+"""Benchmark of the persistence service's upload/download path.
+
+Starts main.py (wsgi, on gunicorn like the image) and/or asgi.py (asgi) in a
+subprocess on a local stand-in for blob storage and measures throughput,
+p50/p99 latency and the peak RSS of the server per object size and
+concurrency. Every scenario is printed as one JSON line, e.g.
+
+    python benchmark.py --server wsgi,asgi --sizes 64KiB,4MiB --concurrency 1,16 > bench.jsonl
+
+Backends: ``memory`` (in-process fake that keeps only the size of blobs),
+``local`` (LocalFileBackend in a temporary directory) or ``azure``
+(CONNECTION_STRING, e.g. an azurite container).
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import shutil
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import main
+
+AUTH_TOKEN = "benchmark-user"
+UNITS = {"KiB": 1024, "MiB": 1024**2, "GiB": 1024**3}
+
+
+# ---------------------------------------------------------------------
+# ------------------------in-memory blob storage-----------------------
+# ---------------------------------------------------------------------
+
+
+class MemoryBackend(main.StorageBackend):
+    """A stand-in for blob storage without any I/O.
+
+    Uploaded content is read and discarded, only its size is kept, so the
+    server's RSS does not grow with every uploaded version. Downloads are
+    served from one shared zero-filled buffer.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.blocks = {}
+        self.zeros = b""
+        self.lock = threading.Lock()
+
+    def _store(self, user, blob_name, size, content_type, overwrite):
+        with self.lock:
+            if not overwrite and (user, blob_name) in self.blobs:
+                raise main.BlobExists(blob_name)
+            etag = f'"{uuid.uuid4().hex}"'
+            modified = datetime.datetime.now(datetime.timezone.utc)
+            self.blobs[(user, blob_name)] = (size, content_type, etag, modified)
+            if size > len(self.zeros):
+                self.zeros = bytes(size)
+
+    def upload(self, user, blob_name, data, content_type, overwrite=True):
+        size = sum(len(chunk) for chunk in main._iter_chunks(data))
+        self._store(user, blob_name, size, content_type, overwrite)
+
+    def download(self, user, blob_name, offset=None, length=None, if_none_match=None):
+        try:
+            size, content_type, etag, modified = self.blobs[(user, blob_name)]
+        except KeyError:
+            raise main.BlobNotFound(blob_name)
+        if if_none_match == etag:
+            raise main.BlobNotModified(blob_name, etag)
+
+        start = offset or 0
+        if offset is not None and offset >= size:
+            raise main.RangeNotSatisfiable(blob_name)
+        end = size if length is None else min(size, start + length)
+        view = memoryview(self.zeros)[start:end]
+        chunks = (
+            bytes(view[i : i + main.DOWNLOAD_CHUNK_SIZE])
+            for i in range(0, len(view), main.DOWNLOAD_CHUNK_SIZE)
+        )
+        return main.BlobDownload(
+            chunks, end - start, size, etag, modified, content_type, offset=offset
+        )
+
+    def exists(self, user, blob_name):
+        return (user, blob_name) in self.blobs
+
+    def stage_block(self, user, blob_name, block_id, data, length):
+        size = sum(len(chunk) for chunk in main._FileChunks(data, length, owned=False))
+        with self.lock:
+            self.blocks.setdefault((user, blob_name), {})[block_id] = size
+
+    def list_staged_blocks(self, user, blob_name):
+        return list(self.blocks.get((user, blob_name), {}))
+
+    def commit_blocks(self, user, blob_name, block_ids, content_type, overwrite=True):
+        staged = self.blocks.get((user, blob_name), {})
+        if not all(block_id in staged for block_id in block_ids):
+            raise main.InvalidBlockList(blob_name)
+        self._store(
+            user,
+            blob_name,
+            sum(staged[block_id] for block_id in block_ids),
+            content_type,
+            overwrite,
+        )
+        with self.lock:
+            self.blocks.pop((user, blob_name), None)
+
+    def list(self, user, prefix):
+        return [
+            {"name": name, "size": blob[0], "last_modified": blob[3]}
+            for (blob_user, name), blob in list(self.blobs.items())
+            if blob_user == user and name.startswith(prefix)
+        ]
+
+
+# ---------------------------------------------------------------------
+# --------------------------------server-------------------------------
+# ---------------------------------------------------------------------
+
+
+def serve(server, backend, port):
+    if backend == "memory":
+        storage = MemoryBackend()
+    else:
+        os.environ["STORAGE_BACKEND"] = backend
+        main.load_env()
+        storage = main.storage
+
+    if server == "wsgi":
+        from gunicorn.app.base import Application
+
+        class Gunicorn(Application):
+            # gunicorn.conf.py of the image, with a single worker so every
+            # request sees the same in-memory blobs
+            def init(self, parser, opts, args):
+                pass
+
+            def load_config(self):
+                self.load_config_from_file(
+                    os.path.join(
+                        os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py"
+                    )
+                )
+                self.cfg.set("bind", f"127.0.0.1:{port}")
+                self.cfg.set("workers", 1)
+                self.cfg.set("loglevel", "warning")
+
+            def load(self):
+                return main.app
+
+        main.storage = storage
+        Gunicorn().run()
+    else:
+        import uvicorn
+        import asgi
+
+        if backend == "memory":
+            asgi.load_env = lambda: setattr(
+                asgi, "storage", asgi.ThreadedBackend(storage)
+            )
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server, backend, env):
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--serve",
+            server,
+            "--backend",
+            backend,
+            "--port",
+            str(port),
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + "/healthcheck", timeout=1).status_code == 200:
+                return process, url
+        except requests.ConnectionError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    process.kill()
+    sys.exit(f"Error: {server} server did not start")
+
+
+# ---------------------------------------------------------------------
+# -------------------------------benchmark-----------------------------
+# ---------------------------------------------------------------------
+
+
+class RssSampler:
+    """Samples the resident set size of a process and its children from /proc until stopped."""
+
+    def __init__(self, pid, interval=0.005):
+        self.pid = pid
+        self.interval = interval
+        self.baseline = self.peak = self.read()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def read(self, pid=None):
+        # The gunicorn worker is a child of the started process
+        pid = pid or self.pid
+        rss = None
+        try:
+            with open(f"/proc/{pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        rss = int(line.split()[1]) * 1024
+            with open(f"/proc/{pid}/task/{pid}/children") as children:
+                for child in children.read().split():
+                    rss = (rss or 0) + (self.read(int(child)) or 0)
+        except OSError:
+            pass
+        return rss
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            rss = self.read()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+_sessions = threading.local()
+
+
+def _session():
+    # One keep-alive connection per client thread
+    if not hasattr(_sessions, "session"):
+        _sessions.session = requests.Session()
+        _sessions.session.headers["x-auth-request-user"] = AUTH_TOKEN
+    return _sessions.session
+
+
+def _upload(url, payload):
+    response = _session().post(
+        url + "/model", files={"file": ("model.zip", payload, "application/zip")}
+    )
+    return response.status_code == 200, len(payload)
+
+
+def _download(url, version):
+    received = 0
+    with _session().get(
+        url + "/model", params={"version": version}, stream=True
+    ) as response:
+        for chunk in response.iter_content(chunk_size=main.DOWNLOAD_CHUNK_SIZE):
+            received += len(chunk)
+        return response.status_code == 200, received
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run_scenario(url, pid, operation, args, size, concurrency, requests_per_scenario):
+    def timed(call_args):
+        start = time.perf_counter()
+        ok, transferred = operation(url, call_args)
+        return time.perf_counter() - start, ok, transferred
+
+    calls = [args(i) for i in range(requests_per_scenario)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Warm up the connections before measuring
+        list(pool.map(timed, calls[:concurrency]))
+        with RssSampler(pid) as rss:
+            start = time.perf_counter()
+            results = list(pool.map(timed, calls))
+            duration = time.perf_counter() - start
+
+    latencies = [latency for latency, _, _ in results]
+    transferred = sum(size for _, ok, size in results if ok)
+    return {
+        "requests": requests_per_scenario,
+        "errors": sum(1 for _, ok, _ in results if not ok),
+        "duration_s": round(duration, 4),
+        "throughput_mib_s": round(transferred / duration / UNITS["MiB"], 2),
+        "requests_per_s": round(requests_per_scenario / duration, 2),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "rss_baseline_mib": (
+            round(rss.baseline / UNITS["MiB"], 1) if rss.baseline else None
+        ),
+        "rss_peak_mib": round(rss.peak / UNITS["MiB"], 1) if rss.peak else None,
+    }
+
+
+def benchmark(
+    server, backend, sizes, concurrency_levels, requests_per_scenario, output
+):
+    env = dict(os.environ)
+    storage_dir = None
+    if backend == "local":
+        storage_dir = tempfile.mkdtemp(prefix="persistence-bench-")
+        env["LOCAL_STORAGE_PATH"] = storage_dir
+
+    process, url = start_server(server, backend, env)
+    try:
+        for size in sizes:
+            # Models are not deduplicated, so every upload can send the same payload
+            payload = os.urandom(min(size, UNITS["MiB"])) * (size // UNITS["MiB"] or 1)
+            payload = payload[:size]
+
+            response = _session().post(
+                url + "/model",
+                files={"file": ("model.zip", payload, "application/zip")},
+            )
+            version = response.json()["version"]
+
+            for concurrency in concurrency_levels:
+                for name, operation, args in [
+                    ("upload", _upload, lambda i: payload),
+                    ("download", _download, lambda i: version),
+                ]:
+                    result = {
+                        "server": server,
+                        "backend": backend,
+                        "operation": name,
+                        "size_bytes": size,
+                        "concurrency": concurrency,
+                        **run_scenario(
+                            url,
+                            process.pid,
+                            operation,
+                            args,
+                            size,
+                            concurrency,
+                            requests_per_scenario,
+                        ),
+                    }
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+    finally:
+        process.terminate()
+        process.wait()
+        if storage_dir:
+            shutil.rmtree(storage_dir, ignore_errors=True)
+
+
+def _parse_size(size):
+    for unit, factor in UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * factor)
+    return int(size)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the persistence service against a local blob store stand-in"
+    )
+    parser.add_argument(
+        "--server",
+        default="wsgi,asgi",
+        help="comma separated: wsgi (main.py), asgi (asgi.py)",
+    )
+    parser.add_argument(
+        "--backend", default="memory", choices=["memory", "local", "azure"]
+    )
+    parser.add_argument(
+        "--sizes", default="64KiB,1MiB,16MiB", help="comma separated object sizes"
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1,8,32",
+        help="comma separated numbers of concurrent clients",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=64, help="requests per scenario"
+    )
+    parser.add_argument(
+        "--output", help="file to append the JSON lines to, stdout by default"
+    )
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.backend, args.port)
+        return
+
+    sizes = [_parse_size(size) for size in args.sizes.split(",")]
+    concurrency_levels = [
+        int(concurrency) for concurrency in args.concurrency.split(",")
+    ]
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for server in args.server.split(","):
+            benchmark(
+                server, args.backend, sizes, concurrency_levels, args.requests, output
+            )
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main_cli()
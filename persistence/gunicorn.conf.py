@@ -0,0 +1,23 @@
+import os
+
+# Gunicorn configuration for the persistence service. Transfers mostly wait on
+# the network or the disk, so a few workers with many threads each. Unlike the
+# werkzeug development server, gunicorn provides wsgi.file_wrapper, whole
+# downloads of the local backend are sent with sendfile.
+
+wsgi_app = "main:create_app({})"
+bind = "0.0.0.0:" + os.getenv("PERSISTENCE_PORT", "5000")
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+
+# Every thread can hold a connection of the blob client's pool (BLOB_POOL_SIZE)
+worker_class = "gthread"
+threads = int(os.getenv("PERSISTENCE_THREADS", "32"))
+
+# Large up- and downloads can take a while on slow clients
+timeout = int(os.getenv("PERSISTENCE_TIMEOUT", "300"))
+
+# Longer than the idle timeout of clients and proxies reusing connections
+# (gunicorn's default is 2s), otherwise a request sent on a connection the
+# worker is just closing fails with a reset
+keepalive = int(os.getenv("PERSISTENCE_KEEPALIVE", "75"))
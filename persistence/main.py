@@ -1,56 +1,503 @@
 import os
 import sys
+import json
+import time
+import base64
 import hashlib
-from flask import Flask, request, send_file, jsonify
+import datetime
+import functools
+import re
+import tempfile
+import uuid
+import requests
+from flask import Flask, Request, Response, request, jsonify, g
+from werkzeug.http import http_date
+from werkzeug.wsgi import wrap_file
 
 import os
-import io
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient, ContentSettings
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobBlock, BlobServiceClient, BlobClient, ContainerClient, ContentSettings
 from dotenv import load_dotenv
 
+#---------------------------------------------------------------------
+#--------------------------storage backends---------------------------
+#---------------------------------------------------------------------
+
+# Downloads are fetched and streamed in chunks of this size
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+class BlobNotFound(Exception):
+    pass
+
+class BlobNotModified(Exception):
+    def __init__(self, blob_name, etag=None):
+        super().__init__(blob_name)
+        # The current ETag of the blob, if the backend knows it
+        self.etag = etag
+
+class BlobExists(Exception):
+    pass
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+class InvalidBlockList(Exception):
+    pass
+
+class BlobDownload:
+    """An open download, the API streams it with chunks() or sends the file at path directly."""
+
+    def __init__(self, chunks, size, total_size, etag, last_modified, content_type, content_md5=None, offset=None, path=None):
+        self.chunks = chunks
+        self.size = size
+        self.total_size = total_size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.content_md5 = content_md5
+        self.offset = offset
+        self.path = path
+
+    @property
+    def content_range(self):
+        return f"bytes {self.offset}-{self.offset + self.size - 1}/{self.total_size}"
+
+class StorageBackend:
+    """Interface of the storage backends. Blobs are addressed by tenant (user) and blob name."""
+
+    def upload(self, user, blob_name, data, content_type, overwrite=True):
+        # Raises BlobExists if overwrite is False and the blob already exists
+        raise NotImplementedError
+
+    def download(self, user, blob_name, offset=None, length=None, if_none_match=None):
+        # Returns a BlobDownload, raises BlobNotFound, BlobNotModified or RangeNotSatisfiable
+        raise NotImplementedError
+
+    def stage_block(self, user, blob_name, block_id, data, length):
+        raise NotImplementedError
+
+    def exists(self, user, blob_name):
+        raise NotImplementedError
+
+    def list_staged_blocks(self, user, blob_name):
+        # Returns the ids of the blocks staged but not yet committed
+        raise NotImplementedError
+
+    def commit_blocks(self, user, blob_name, block_ids, content_type, overwrite=True):
+        # Replaces the blob with the blocks in order, raises InvalidBlockList if one is missing
+        raise NotImplementedError
+
+    def list(self, user, prefix):
+        # Returns [{"name", "size", "last_modified"}] of the blobs starting with prefix
+        raise NotImplementedError
+
+class AzureBlobBackend(StorageBackend):
+    def __init__(self, connection_string, container_cache_ttl, pool_size, upload_concurrency):
+        self.container_cache_ttl = container_cache_ttl
+        self.upload_concurrency = upload_concurrency
+
+        # container name -> time until which it is known to exist
+        self.known_containers = {}
+
+        # One BlobServiceClient per process, so all requests share its connection pool
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        transport = RequestsTransport(session=session, session_owner=False)
+        self.blob_service_client = BlobServiceClient.from_connection_string(
+            connection_string,
+            transport=transport,
+            max_single_get_size=DOWNLOAD_CHUNK_SIZE,
+            max_chunk_get_size=DOWNLOAD_CHUNK_SIZE,
+        )
+
+    def ensure_container(self, container_client):
+        container_name = container_client.container_name
+        if self.known_containers.get(container_name, 0) > time.monotonic():
+            return
+
+        # A single create call, instead of exists() followed by create
+        try:
+            container_client.create_container()
+            print(f"Container '{container_name}' created.")
+        except ResourceExistsError:
+            pass
+        self.known_containers[container_name] = time.monotonic() + self.container_cache_ttl
+
+    def get_blob_client(self, user, blob_name):
+        container_name = user
+        container_client = self.blob_service_client.get_container_client(container_name)
+        self.ensure_container(container_client)
+        blob_client = container_client.get_blob_client(blob_name)
+        return blob_client
+
+    def upload(self, user, blob_name, data, content_type, overwrite=True):
+        blob_client = self.get_blob_client(user, blob_name)
+
+        # overwrite replaces the blob in the same request, no exists()/delete_blob() round trips,
+        # large files are sent as blocks over several connections in parallel
+        content_settings = ContentSettings(content_type=content_type)
+        try:
+            blob_client.upload_blob(data, content_settings=content_settings, overwrite=overwrite, max_concurrency=self.upload_concurrency)
+        except ResourceExistsError:
+            raise BlobExists(blob_name)
+
+    def download(self, user, blob_name, offset=None, length=None, if_none_match=None):
+        blob_client = self.get_blob_client(user, blob_name)
+
+        # Revalidation is done by the storage service in the same request
+        conditions = {}
+        if if_none_match:
+            conditions = {"etag": if_none_match, "match_condition": MatchConditions.IfModified}
+
+        # A single request, the downloader carries the blob properties and yields the content in chunks
+        try:
+            downloader = blob_client.download_blob(offset=offset, length=length, **conditions)
+        except ResourceNotFoundError:
+            raise BlobNotFound(blob_name)
+        except HttpResponseError as e:
+            if e.status_code == 304:
+                raise BlobNotModified(blob_name, e.response.headers.get("ETag") if e.response is not None else None)
+            if e.status_code == 416:
+                raise RangeNotSatisfiable(blob_name)
+            raise
+
+        properties = downloader.properties
+        content_settings = properties.content_settings
+        total_size = int(properties.content_range.rsplit("/", 1)[1])
+        return BlobDownload(
+            downloader.chunks(),
+            downloader.size,
+            total_size,
+            properties.etag,
+            properties.last_modified,
+            content_settings.content_type,
+            content_md5=content_settings.content_md5,
+            offset=offset,
+        )
+
+    def exists(self, user, blob_name):
+        return self.get_blob_client(user, blob_name).exists()
+
+    def stage_block(self, user, blob_name, block_id, data, length):
+        blob_client = self.get_blob_client(user, blob_name)
+        blob_client.stage_block(block_id, data, length=length)
+
+    def list_staged_blocks(self, user, blob_name):
+        blob_client = self.get_blob_client(user, blob_name)
+        try:
+            _, uncommitted = blob_client.get_block_list("uncommitted")
+        except ResourceNotFoundError:
+            return []
+        return [block.id for block in uncommitted]
+
+    def commit_blocks(self, user, blob_name, block_ids, content_type, overwrite=True):
+        blob_client = self.get_blob_client(user, blob_name)
+        block_list = [BlobBlock(block_id) for block_id in block_ids]
+        content_settings = ContentSettings(content_type=content_type)
+
+        # Without overwrite the commit only succeeds if the blob does not exist yet
+        conditions = {}
+        if not overwrite:
+            conditions = {"etag": "*", "match_condition": MatchConditions.IfMissing}
+        try:
+            blob_client.commit_block_list(block_list, content_settings=content_settings, **conditions)
+        except (ResourceExistsError, ResourceModifiedError):
+            raise BlobExists(blob_name)
+        except HttpResponseError as e:
+            if e.error_code == "InvalidBlockList":
+                raise InvalidBlockList(blob_name)
+            raise
+
+    def list(self, user, prefix):
+        container_client = self.blob_service_client.get_container_client(user)
+        try:
+            return [
+                {"name": blob.name, "size": blob.size, "last_modified": blob.last_modified}
+                for blob in container_client.list_blobs(name_starts_with=prefix)
+            ]
+        except ResourceNotFoundError:
+            return []
+
+class LocalFileBackend(StorageBackend):
+    """Stores blobs as files in one directory per tenant, e.g. on a local NVMe disk.
+
+    Files are written next to their target and renamed into place, so readers
+    only ever see complete blobs. The content type and MD5 live in a sidecar
+    file under .meta, staged blocks under .blocks.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, user, *parts):
+        path = os.path.abspath(os.path.join(self.root, user, *parts))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid blob name '{os.path.join(*parts)}'")
+        return path
+
+    def _meta_path(self, user, blob_name):
+        return self._path(user, ".meta", blob_name + ".json")
+
+    def _block_dir(self, user, blob_name):
+        return self._path(user, ".blocks", blob_name)
+
+    def _write_atomic(self, path, chunks, overwrite=True):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{uuid.uuid4()}"
+        md5 = hashlib.md5()
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    md5.update(chunk)
+            if overwrite:
+                os.replace(tmp_path, path)
+            else:
+                # link() fails if the target exists, unlike rename()
+                os.link(tmp_path, path)
+        except FileExistsError:
+            raise BlobExists(os.path.basename(path))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return md5.digest()
+
+    def _write_meta(self, user, blob_name, content_type, content_md5):
+        meta = {"content_type": content_type, "content_md5": base64.b64encode(content_md5).decode()}
+        self._write_atomic(self._meta_path(user, blob_name), [json.dumps(meta).encode()])
+
+    def upload(self, user, blob_name, data, content_type, overwrite=True):
+        content_md5 = self._write_atomic(self._path(user, blob_name), _iter_chunks(data), overwrite)
+        self._write_meta(user, blob_name, content_type, content_md5)
+
+    def download(self, user, blob_name, offset=None, length=None, if_none_match=None):
+        path = self._path(user, blob_name)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            raise BlobNotFound(blob_name)
+
+        # The ETag is derived from the file itself, it changes with every rename into place
+        stat = os.fstat(f.fileno())
+        etag = f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if if_none_match and (if_none_match == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+            f.close()
+            raise BlobNotModified(blob_name, etag)
+
+        meta = {}
+        try:
+            with open(self._meta_path(user, blob_name), "r") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            pass
+
+        size = stat.st_size
+        if offset is not None:
+            if offset >= stat.st_size:
+                f.close()
+                raise RangeNotSatisfiable(blob_name)
+            f.seek(offset)
+            size = stat.st_size - offset if length is None else min(length, stat.st_size - offset)
+
+        content_md5 = base64.b64decode(meta["content_md5"]) if meta.get("content_md5") else None
+        return BlobDownload(
+            _FileChunks(f, size),
+            size,
+            stat.st_size,
+            etag,
+            datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc),
+            meta.get("content_type", "application/octet-stream"),
+            content_md5=content_md5,
+            offset=offset,
+            path=path,
+        )
+
+    def exists(self, user, blob_name):
+        return os.path.isfile(self._path(user, blob_name))
+
+    def stage_block(self, user, blob_name, block_id, data, length):
+        block_path = os.path.join(self._block_dir(user, blob_name), block_id)
+        # The request stream belongs to the server, gunicorn's has no close()
+        self._write_atomic(block_path, _FileChunks(data, length, owned=False))
+
+    def list_staged_blocks(self, user, blob_name):
+        try:
+            return [name for name in os.listdir(self._block_dir(user, blob_name)) if ".tmp-" not in name]
+        except FileNotFoundError:
+            return []
+
+    def commit_blocks(self, user, blob_name, block_ids, content_type, overwrite=True):
+        block_dir = self._block_dir(user, blob_name)
+        block_paths = [os.path.join(block_dir, block_id) for block_id in block_ids]
+        if not all(os.path.exists(block_path) for block_path in block_paths):
+            raise InvalidBlockList(blob_name)
+
+        def chunks():
+            for block_path in block_paths:
+                with open(block_path, "rb") as f:
+                    yield from _FileChunks(f, os.path.getsize(block_path))
+
+        content_md5 = self._write_atomic(self._path(user, blob_name), chunks(), overwrite)
+        self._write_meta(user, blob_name, content_type, content_md5)
+        for block_path in block_paths:
+            os.remove(block_path)
+
+    def list(self, user, prefix):
+        # Only the directory of the prefix is scanned, blob names below it are not listed
+        directory, name_prefix = os.path.split(prefix)
+        blobs = []
+        try:
+            entries = list(os.scandir(self._path(user, directory or ".")))
+        except FileNotFoundError:
+            return []
+        for entry in entries:
+            if not entry.is_file() or not entry.name.startswith(name_prefix) or ".tmp-" in entry.name:
+                continue
+            stat = entry.stat()
+            blobs.append({
+                "name": os.path.join(directory, entry.name),
+                "size": stat.st_size,
+                "last_modified": datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc),
+            })
+        return blobs
+
+def _iter_chunks(data):
+    # Uploads may be str, bytes or file-like objects like werkzeug's FileStorage
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if isinstance(data, (bytes, bytearray)):
+        yield bytes(data)
+        return
+    while True:
+        chunk = data.read(DOWNLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+class _FileChunks:
+    """Reads size bytes of an open file in chunks, the file is closed at the end or on close() if owned."""
+
+    def __init__(self, file, size, owned=True):
+        self.file = file
+        self.remaining = size
+        self.owned = owned
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self.file.read(min(DOWNLOAD_CHUNK_SIZE, self.remaining)) if self.remaining > 0 else b""
+        if not chunk:
+            self.close()
+            raise StopIteration
+        self.remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+storage = None
+
 def load_env():
     load_dotenv()
-    global connection_string
-    connection_string  = os.getenv("CONNECTION_STRING")
-
-# Create a BlobServiceClient
+    global storage
+    backend = os.getenv("STORAGE_BACKEND", "azure")
+    if backend == "local":
+        storage = LocalFileBackend(os.getenv("LOCAL_STORAGE_PATH", "./storage"))
+    elif backend == "azure":
+        storage = AzureBlobBackend(
+            os.getenv("CONNECTION_STRING"),
+            container_cache_ttl=float(os.getenv("CONTAINER_CACHE_TTL", "300")),
+            pool_size=int(os.getenv("BLOB_POOL_SIZE", "32")),
+            upload_concurrency=int(os.getenv("UPLOAD_CONCURRENCY", "4")),
+        )
+    else:
+        sys.exit(f"Error: Unknown STORAGE_BACKEND '{backend}'")
+
+def upload_data(user,blob_name,data,content_type,overwrite=True):
+    storage.upload(user, blob_name, data, content_type, overwrite)
+
+def download_blob(user, blob_name, offset=None, length=None, if_none_match=None):
+    return storage.download(user, blob_name, offset, length, if_none_match)
+
+def blob_exists(user, blob_name):
+    return storage.exists(user, blob_name)
+
+# Chunked uploads stage blocks on the target blob, the blob only changes on commit.
+# Block ids carry the upload id, so an interrupted upload can find its blocks again
+def _block_id(upload_id, index):
+    return f"{upload_id}-{index:06d}"
+
+def stage_block(user,blob_name,upload_id,index,data,length):
+    storage.stage_block(user, blob_name, _block_id(upload_id, index), data, length)
+
+def list_staged_blocks(user,blob_name,upload_id):
+    prefix = f"{upload_id}-"
+    block_ids = storage.list_staged_blocks(user, blob_name)
+    return sorted(int(block_id[len(prefix):]) for block_id in block_ids if block_id.startswith(prefix))
+
+def commit_blocks(user,blob_name,upload_id,block_count,content_type,overwrite=True):
+    block_ids = [_block_id(upload_id, index) for index in range(block_count)]
+    storage.commit_blocks(user, blob_name, block_ids, content_type, overwrite)
+
+# Every upload is stored as an immutable version, "latest" points to the most
+# recently completed one and is replaced atomically after the upload. Readers
+# therefore never see a partial artifact, whatever is being uploaded meanwhile
+def _version_blob(endpoint, version):
+    return f"versions/{endpoint}/{version}"
+
+def _latest_blob(endpoint):
+    return f"latest/{endpoint}"
+
+def get_latest_version(user,endpoint):
+    try:
+        download = download_blob(user, _latest_blob(endpoint))
+    except BlobNotFound:
+        return None
+    return json.loads(b"".join(download.chunks))["version"]
 
-def get_blob_client(user,blob_name):
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-    container_name = user
-    container_client = blob_service_client.get_container_client(container_name)
-    if not container_client.exists():
-        container_client.create_container()
-        print(f"Container '{container_name}' created.")
-    blob_client = container_client.get_blob_client(blob_name)
-    return blob_client
+def set_latest_version(user,endpoint,version):
+    upload_data(user, _latest_blob(endpoint), json.dumps({"version": version}), "application/json")
 
-def upload_data(user,blob_name,data,content_type):
-    blob_client = get_blob_client(user,blob_name)
-    if blob_client.exists():
-        blob_client.delete_blob()
+def list_versions(user,endpoint):
+    prefix = _version_blob(endpoint, "")
+    blobs = sorted(storage.list(user, prefix), key=lambda blob: blob["last_modified"])
+    return [
+        {"version": blob["name"][len(prefix):], "size": blob["size"], "last_modified": http_date(blob["last_modified"])}
+        for blob in blobs
+    ]
 
-    content_settings = ContentSettings(content_type=content_type)
-    blob_client.upload_blob(data, content_settings=content_settings)
 
-def download_blob(user, blob_name):
-    blob_client = get_blob_client(user,blob_name)
-    if not blob_client.exists():
-        raise Exception(f"Blob '{blob_name}' does not exist.")
+class _HashingFile:
+    """Temporary file for an uploaded file, hashes the content while the request body is written to it."""
 
-    download_stream = blob_client.download_blob()
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_CHUNK_SIZE)
+        self.sha256 = hashlib.sha256()
 
-    blob_data = io.BytesIO()
-    blob_data.write(download_stream.read())
-    blob_data.seek(0)  # Reset the stream position to the beginning
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
 
-    # Get the content type of the blob
-    content_type = blob_client.get_blob_properties().content_settings.content_type
+    def __iter__(self):
+        return iter(self.file)
 
-    return blob_data, content_type
+    def __getattr__(self, name):
+        return getattr(self.file, name)
 
+class HashingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return _HashingFile()
 
 app = Flask(__name__)
+# Uploaded files carry the sha256 of their content, without reading them a second time
+app.request_class = HashingRequest
 
 # sha256 helper
 def _sha1(input_string):
@@ -59,9 +506,37 @@ def _sha1(input_string):
     sha256_hash = hashlib.sha1(input_string).hexdigest()
     return sha256_hash
 
-def _get_user_sha(request):
-    user_id = request.headers.get('x-auth-request-user')
-    return _sha1(user_id)
+# Number of tenants whose context is kept in memory
+TENANT_CACHE_SIZE = 1024
+
+class TenantContext:
+    """A tenant and the names of its storage, derived from its auth header."""
+
+    def __init__(self, auth_header):
+        self.auth_header = auth_header
+        self.hash = _sha1(auth_header)
+        # Container (or directory of the local backend) holding the tenant's blobs
+        self.container = self.hash
+
+# Contexts are immutable, so one instance per tenant is shared by all requests
+@functools.lru_cache(maxsize=TENANT_CACHE_SIZE)
+def get_tenant(auth_header):
+    return TenantContext(auth_header)
+
+def _is_version(version):
+    # Versions end up in blob names, e.g. a training job id or the sha256 of a dataset
+    return bool(re.fullmatch(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,63}', version or ''))
+
+def _is_upload_id(upload_id, endpoint):
+    # The upload id is a version, block ids (upload id + "-" + 6 digit index) are limited to 64 bytes.
+    # Dataset versions named like a sha256 are taken as the hash of their content, the blocks of a
+    # chunked upload are not hashed, so such names are reserved for _upload_dataset
+    if endpoint == "data" and _is_sha256(upload_id):
+        return False
+    return _is_version(upload_id) and len(upload_id) <= 57
+
+def _is_sha256(content_hash):
+    return bool(re.fullmatch(r'[0-9a-f]{64}', content_hash or ''))
 
 
 #---------------------------------------------------------------------
@@ -79,25 +554,215 @@ def _upload_to_blob_storage(request,endpoint):
         print("File is empty", file=sys.stderr)
         return jsonify({"error": "File is empty"}), 400
     
-    user = _get_user_sha(request)
+    version = request.values.get('version') or str(uuid.uuid4())
+    if not _is_version(version):
+        return jsonify({"error": "Invalid version"}), 400
+
+    user = g.tenant.container
     
     content_type = file.content_type
     try:
-        upload_data(user,endpoint,file, content_type)
-        return jsonify({"status":"OK"}), 200
+        upload_data(user,_version_blob(endpoint,version),file, content_type, overwrite=False)
+        set_latest_version(user,endpoint,version)
+        return jsonify({"status":"OK", "version": version}), 200
+    except BlobExists as e:
+        print(e, file=sys.stderr)
+        return jsonify({"error": "Version already exists"}), 409
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return jsonify({"error": "Data upload failed"}), 500
+
+# Datasets are content addressed: their version is the sha256 of the zip, so
+# the same dataset is stored once however often it is uploaded. A client can
+# send only the X-Content-SHA256 header first and skip the upload if it is known
+def _upload_dataset(request,endpoint):
+    claimed_hash = request.headers.get('X-Content-SHA256', '').lower() or None
+    if claimed_hash is not None and not _is_sha256(claimed_hash):
+        return jsonify({"error": "Invalid content hash"}), 400
+
+    user = g.tenant.container
+    file = request.files.get('file')
+    if file is None and claimed_hash is None:
+        print("No file found in request", file=sys.stderr)
+        return jsonify({"error": "No file provided"}), 400
+    if file is not None and file.filename == '':
+        print("File is empty", file=sys.stderr)
+        return jsonify({"error": "File is empty"}), 400
+
+    try:
+        if file is None:
+            if not blob_exists(user,_version_blob(endpoint,claimed_hash)):
+                return jsonify({"error": "Unknown content, upload the file"}), 404
+            set_latest_version(user,endpoint,claimed_hash)
+            return jsonify({"status":"OK", "version": claimed_hash, "deduplicated": True}), 200
+
+        content_hash = file.stream.sha256.hexdigest()
+        if claimed_hash is not None and claimed_hash != content_hash:
+            return jsonify({"error": "Content hash mismatch"}), 400
+
+        blob_name = _version_blob(endpoint,content_hash)
+        deduplicated = blob_exists(user,blob_name)
+        if not deduplicated:
+            try:
+                upload_data(user,blob_name,file,file.content_type,overwrite=False)
+            except BlobExists:
+                # Uploaded concurrently with the same content
+                deduplicated = True
+        set_latest_version(user,endpoint,content_hash)
+        return jsonify({"status":"OK", "version": content_hash, "deduplicated": deduplicated}), 200
     except Exception as e:
         print(e, file=sys.stderr)
         return jsonify({"error": "Data upload failed"}), 500
-   
-def _download_from_blob_storage(request,endpoint):
+
+def _requested_range(request):
+    # Only a single range with a start offset maps onto a ranged blob download,
+    # anything else (suffix ranges, multiple ranges, If-Range) gets the full blob
+    if request.range is None or request.headers.get('If-Range'):
+        return None, None
+    if request.range.units != "bytes" or len(request.range.ranges) != 1:
+        return None, None
+
+    start, stop = request.range.ranges[0]
+    if start < 0:
+        return None, None
+    return start, (stop - start if stop is not None else None)
+
+def _download_from_blob_storage(request,blob_name,headers):
+    offset, length = _requested_range(request)
+    if_none_match = request.headers.get('If-None-Match')
     try:
-        user = _get_user_sha(request)
-        blob_data, content_type = download_blob(user, endpoint)
-        return send_file(blob_data,download_name="data", as_attachment=True, mimetype=content_type)
+        user = g.tenant.container
+        download = download_blob(user, blob_name, offset, length, if_none_match)
+    except BlobNotFound:
+        print(f"Blob '{blob_name}' does not exist.", file=sys.stderr)
+        return jsonify({"error": "Data not found"}), 404
+    except BlobNotModified as e:
+        # The stored blob's ETag, a list sent by the client must not be echoed
+        return Response(status=304, headers={**({"ETag": e.etag} if e.etag else {}), **headers})
+    except RangeNotSatisfiable:
+        return jsonify({"error": "Requested range not satisfiable"}), 416
     except Exception as e:
         print(e, file=sys.stderr)
         return jsonify({"error": "Data not found"}), 404
 
+    # Headers come from the download itself, no extra properties call
+    headers = {
+        **headers,
+        "Content-Length": str(download.size),
+        "Content-Disposition": "attachment; filename=data",
+        "Accept-Ranges": "bytes",
+        "ETag": download.etag,
+        "Last-Modified": http_date(download.last_modified),
+    }
+
+    status = 200
+    if offset is not None:
+        status = 206
+        headers["Content-Range"] = download.content_range
+    elif download.content_md5:
+        headers["Content-MD5"] = base64.b64encode(download.content_md5).decode()
+
+    # Whole local files go out through the server's file wrapper (sendfile where
+    # supported), everything else is streamed chunk by chunk so memory stays flat
+    body = download.chunks
+    if download.path is not None and offset is None:
+        body = wrap_file(request.environ, download.chunks.file, DOWNLOAD_CHUNK_SIZE)
+    return Response(body, status=status, mimetype=download.content_type, headers=headers, direct_passthrough=True)
+
+def _download_version(request,endpoint):
+    user = g.tenant.container
+    version = request.args.get('version')
+    headers = {}
+    if version is not None:
+        if not _is_version(version):
+            return jsonify({"error": "Invalid version"}), 400
+        # A version never changes, so it can be cached forever
+        headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        try:
+            version = get_latest_version(user,endpoint)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            return jsonify({"error": "Data not found"}), 404
+
+    # Tenants without any version still have the single blob of older releases
+    if version is None:
+        return _download_from_blob_storage(request,endpoint,headers)
+    headers["X-Artifact-Version"] = version
+    return _download_from_blob_storage(request,_version_blob(endpoint,version),headers)
+
+def _list_versions(request,endpoint):
+    user = g.tenant.container
+    try:
+        return jsonify({"latest": get_latest_version(user,endpoint), "versions": list_versions(user,endpoint)}), 200
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return jsonify({"error": "Listing versions failed"}), 500
+
+
+
+#---------------------------------------------------------------------
+#-----------------------chunked upload functions----------------------
+#---------------------------------------------------------------------
+
+# The upload id is the version being uploaded, its blocks are staged on the version blob
+
+def _start_chunked_upload(request,endpoint):
+    body = request.get_json(silent=True) or {}
+    version = body.get("version") or str(uuid.uuid4())
+    if not _is_upload_id(version,endpoint):
+        return jsonify({"error": "Invalid version"}), 400
+    return jsonify({"upload_id": version, "version": version}), 200
+
+def _put_block(request,endpoint,upload_id,index):
+    if not _is_upload_id(upload_id,endpoint):
+        return jsonify({"error": "Invalid upload id"}), 400
+    if not request.content_length:
+        return jsonify({"error": "Block is empty"}), 400
+
+    user = g.tenant.container
+    try:
+        stage_block(user,_version_blob(endpoint,upload_id),upload_id,index,request.stream,request.content_length)
+        return jsonify({"status":"OK"}), 200
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return jsonify({"error": "Block upload failed"}), 500
+
+def _get_chunked_upload(request,endpoint,upload_id):
+    if not _is_upload_id(upload_id,endpoint):
+        return jsonify({"error": "Invalid upload id"}), 400
+
+    user = g.tenant.container
+    try:
+        return jsonify({"upload_id": upload_id, "blocks": list_staged_blocks(user,_version_blob(endpoint,upload_id),upload_id)}), 200
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return jsonify({"error": "Listing blocks failed"}), 500
+
+def _commit_chunked_upload(request,endpoint,upload_id):
+    if not _is_upload_id(upload_id,endpoint):
+        return jsonify({"error": "Invalid upload id"}), 400
+
+    body = request.get_json(silent=True) or {}
+    block_count = body.get("blocks")
+    if not isinstance(block_count, int) or block_count < 1:
+        return jsonify({"error": "Number of blocks missing"}), 400
+    content_type = body.get("content_type", "application/octet-stream")
+
+    user = g.tenant.container
+    try:
+        commit_blocks(user,_version_blob(endpoint,upload_id),upload_id,block_count,content_type,overwrite=False)
+        set_latest_version(user,endpoint,upload_id)
+        return jsonify({"status":"OK", "version": upload_id}), 200
+    except InvalidBlockList as e:
+        print(e, file=sys.stderr)
+        return jsonify({"error": "Not all blocks have been uploaded"}), 400
+    except BlobExists as e:
+        print(e, file=sys.stderr)
+        return jsonify({"error": "Version already exists"}), 409
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return jsonify({"error": "Data upload failed"}), 500
 
 
 #---------------------------------------------------------------------
@@ -106,11 +771,15 @@ def _download_from_blob_storage(request,endpoint):
 
 @app.route('/data', methods=['POST'])
 def upload_file():
-    return _upload_to_blob_storage(request,"data")
+    return _upload_dataset(request,"data")
 
 @app.route('/data', methods=['GET'])
 def get_file():
-    return _download_from_blob_storage(request,"data")
+    return _download_version(request,"data")
+
+@app.route('/data/versions', methods=['GET'])
+def list_data_versions():
+    return _list_versions(request,"data")
 
 @app.route('/model', methods=['POST'])
 def upload_model():
@@ -118,7 +787,73 @@ def upload_model():
 
 @app.route('/model', methods=['GET'])
 def get_model():
-    return _download_from_blob_storage(request,"model")
+    return _download_version(request,"model")
+
+@app.route('/model/versions', methods=['GET'])
+def list_model_versions():
+    return _list_versions(request,"model")
+
+@app.route('/data/uploads', methods=['POST'])
+def start_data_upload():
+    return _start_chunked_upload(request,"data")
+
+@app.route('/data/uploads/<upload_id>', methods=['GET'])
+def get_data_upload(upload_id):
+    return _get_chunked_upload(request,"data",upload_id)
+
+@app.route('/data/uploads/<upload_id>/blocks/<int:index>', methods=['PUT'])
+def put_data_block(upload_id, index):
+    return _put_block(request,"data",upload_id,index)
+
+@app.route('/data/uploads/<upload_id>/commit', methods=['POST'])
+def commit_data_upload(upload_id):
+    return _commit_chunked_upload(request,"data",upload_id)
+
+@app.route('/model/uploads', methods=['POST'])
+def start_model_upload():
+    return _start_chunked_upload(request,"model")
+
+@app.route('/model/uploads/<upload_id>', methods=['GET'])
+def get_model_upload(upload_id):
+    return _get_chunked_upload(request,"model",upload_id)
+
+@app.route('/model/uploads/<upload_id>/blocks/<int:index>', methods=['PUT'])
+def put_model_block(upload_id, index):
+    return _put_block(request,"model",upload_id,index)
+
+@app.route('/model/uploads/<upload_id>/commit', methods=['POST'])
+def commit_model_upload(upload_id):
+    return _commit_chunked_upload(request,"model",upload_id)
+
+# Preprocessed training data (e.g. the TFRecord shards of a dataset), stored
+# like models under a version the training service derives from the dataset
+@app.route('/cache', methods=['POST'])
+def upload_cache():
+    return _upload_to_blob_storage(request,"cache")
+
+@app.route('/cache', methods=['GET'])
+def get_cache():
+    return _download_version(request,"cache")
+
+@app.route('/cache/versions', methods=['GET'])
+def list_cache_versions():
+    return _list_versions(request,"cache")
+
+@app.route('/cache/uploads', methods=['POST'])
+def start_cache_upload():
+    return _start_chunked_upload(request,"cache")
+
+@app.route('/cache/uploads/<upload_id>', methods=['GET'])
+def get_cache_upload(upload_id):
+    return _get_chunked_upload(request,"cache",upload_id)
+
+@app.route('/cache/uploads/<upload_id>/blocks/<int:index>', methods=['PUT'])
+def put_cache_block(upload_id, index):
+    return _put_block(request,"cache",upload_id,index)
+
+@app.route('/cache/uploads/<upload_id>/commit', methods=['POST'])
+def commit_cache_upload(upload_id):
+    return _commit_chunked_upload(request,"cache",upload_id)
 
 @app.route('/')
 def hello_world():
@@ -138,10 +873,14 @@ def enforce_auth_header():
     if request.path == '/healthcheck':
         return
     
-    if not request.headers.get('x-auth-request-user'):
+    auth_header = request.headers.get('x-auth-request-user')
+    if not auth_header:
         #optionally redirect here?
         return jsonify({"error": "x-auth-request-user header is missing"}), 401
 
+    # The header is resolved once per request, the handlers use g.tenant
+    g.tenant = get_tenant(auth_header)
+
 
 def create_app(config):
     load_env()
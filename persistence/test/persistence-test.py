@@ -1,7 +1,13 @@
 import pytest
+import io
+import hashlib
 import os
+import uuid
 
-from ..main import create_app, load_env, upload_data
+from starlette.testclient import TestClient
+
+from ..main import create_app, load_env, upload_data, get_tenant, LocalFileBackend, BlobNotModified
+from ..asgi import app as asgi_app
 
 
 AUTH_TOKEN = "12341234-aklasiueon"
@@ -24,6 +30,28 @@ def test_azurite_contaienr():
     load_env()
     upload_data("test","test_file.txt","This is a test file.","text/plain")
 
+
+def test_local_backend(tmp_path):
+    storage = LocalFileBackend(str(tmp_path))
+    storage.upload("test", "test_file.txt", TEST_FILE_CONTENT, "text/plain")
+
+    download = storage.download("test", "test_file.txt", offset=5, length=2)
+    assert b"".join(download.chunks) == b"is"
+    assert download.content_range == "bytes 5-6/20"
+    assert download.content_type == "text/plain"
+
+    with pytest.raises(BlobNotModified):
+        storage.download("test", "test_file.txt", if_none_match=download.etag)
+
+    # Only the blob and its metadata are left, no temporary files
+    assert sorted(os.listdir(tmp_path / "test")) == [".meta", "test_file.txt"]
+
+def test_tenant_context_is_cached():
+    tenant = get_tenant(AUTH_TOKEN)
+    assert tenant is get_tenant(AUTH_TOKEN)
+    assert tenant.container == tenant.hash
+    assert get_tenant("other-user").container != tenant.container
+
 #-------------------Test cases for the hello world endpoint-------------------
 
 
@@ -67,6 +95,28 @@ def test_GET_data_with_valid_token(client):
     assert response.text == TEST_FILE_CONTENT
 
 
+def test_GET_data_range_with_valid_token(client):
+    response = client.get('/data', headers={'x-auth-request-user': AUTH_TOKEN, 'Range': 'bytes=5-8'})
+    assert response.status_code == 206
+    assert response.text == TEST_FILE_CONTENT[5:9]
+    assert response.headers['Content-Range'] == f'bytes 5-8/{len(TEST_FILE_CONTENT)}'
+
+
+def test_GET_data_not_modified(client):
+    response = client.get('/data', headers={'x-auth-request-user': AUTH_TOKEN})
+    etag = response.headers['ETag']
+
+    response = client.get('/data', headers={'x-auth-request-user': AUTH_TOKEN, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    # Any tag of a list matches, the response names the stored one
+    response = client.get('/data', headers={'x-auth-request-user': AUTH_TOKEN, 'If-None-Match': f'"stale", {etag}'})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
 def test_GET_data_without_token(client):
     # Send a GET request without the x-auth-request-user header
     response = client.get('/data')
@@ -108,4 +158,177 @@ def test_GET_model_without_token(client):
     # Send a GET request without the x-auth-request-user header
     response = client.get('/model')
     assert response.status_code == 401
-    assert response.json == {"error": "x-auth-request-user header is missing"}
\ No newline at end of file
+    assert response.json == {"error": "x-auth-request-user header is missing"}
+
+#-------------------Test cases for chunked uploads -------------------
+
+def test_chunked_upload_with_token(client):
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    response = client.post('/data/uploads', headers=headers)
+    assert response.status_code == 200
+    upload_id = response.json["upload_id"]
+
+    # Upload the blocks out of order, like parallel clients would
+    blocks = [TEST_FILE_CONTENT[i:i + 8].encode() for i in range(0, len(TEST_FILE_CONTENT), 8)]
+    for index in reversed(range(len(blocks))):
+        response = client.put(f'/data/uploads/{upload_id}/blocks/{index}', headers=headers, data=blocks[index])
+        assert response.status_code == 200
+
+    response = client.get(f'/data/uploads/{upload_id}', headers=headers)
+    assert response.json["blocks"] == list(range(len(blocks)))
+
+    response = client.post(f'/data/uploads/{upload_id}/commit', headers=headers, json={"blocks": len(blocks), "content_type": "text/plain"})
+    assert response.status_code == 200
+
+    response = client.get('/data', headers=headers)
+    assert response.text == TEST_FILE_CONTENT
+
+
+def test_chunked_upload_leaves_request_stream_open(client):
+    # The stream belongs to the server, gunicorn's request body has no close()
+    headers = {'x-auth-request-user': AUTH_TOKEN, 'Content-Length': '5'}
+    upload_id = client.post('/data/uploads', headers=headers).json["upload_id"]
+    body = io.BytesIO(b"block")
+    response = client.put(f'/data/uploads/{upload_id}/blocks/0', headers=headers, input_stream=body, environ_overrides={'wsgi.input_terminated': True})
+    assert response.status_code == 200
+    assert not body.closed
+
+
+def test_chunked_upload_commit_with_missing_block(client):
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    upload_id = client.post('/data/uploads', headers=headers).json["upload_id"]
+    client.put(f'/data/uploads/{upload_id}/blocks/1', headers=headers, data=b"block")
+
+    response = client.post(f'/data/uploads/{upload_id}/commit', headers=headers, json={"blocks": 2})
+    assert response.status_code == 400
+
+
+def test_chunked_upload_rejects_content_hash_version(client):
+    # Dataset versions named like a sha256 are trusted to be the hash of their content
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    content_hash = hashlib.sha256(b"other content").hexdigest()
+    response = client.post('/data/uploads', headers=headers, json={"version": content_hash})
+    assert response.status_code == 400
+
+    response = client.put(f'/data/uploads/{content_hash}/blocks/0', headers=headers, data=b"block")
+    assert response.status_code == 400
+
+#-------------------Test cases for versions -------------------
+
+def test_versions_with_token(client):
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    v1, v2 = str(uuid.uuid4()), str(uuid.uuid4())
+    for version, content in [(v1, b"first"), (v2, b"second")]:
+        response = client.post('/model', headers=headers, data={'file': (io.BytesIO(content), 'model.zip'), 'version': version})
+        assert response.status_code == 200
+        assert response.json["version"] == version
+
+    # Without a version the latest one is returned
+    response = client.get('/model', headers=headers)
+    assert response.data == b"second"
+    assert response.headers['X-Artifact-Version'] == v2
+
+    response = client.get(f'/model?version={v1}', headers=headers)
+    assert response.data == b"first"
+    assert 'immutable' in response.headers['Cache-Control']
+
+    response = client.get('/model/versions', headers=headers)
+    assert response.json["latest"] == v2
+    assert {v1, v2} <= {v["version"] for v in response.json["versions"]}
+
+
+def test_versions_are_immutable(client):
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    version = str(uuid.uuid4())
+    response = client.post('/model', headers=headers, data={'file': (io.BytesIO(b"data"), 'model.zip'), 'version': version})
+    assert response.status_code == 200
+
+    response = client.post('/model', headers=headers, data={'file': (io.BytesIO(b"other"), 'model.zip'), 'version': version})
+    assert response.status_code == 409
+
+    response = client.get(f'/model?version={version}', headers=headers)
+    assert response.data == b"data"
+
+def test_cache_upload_and_download(client):
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    version = f"{uuid.uuid4().hex}-180x180"
+    response = client.get(f'/cache?version={version}', headers=headers)
+    assert response.status_code == 404
+
+    upload_id = client.post('/cache/uploads', headers=headers, json={"version": version}).json["upload_id"]
+    client.put(f'/cache/uploads/{upload_id}/blocks/0', headers=headers, data=b"shards")
+    response = client.post(f'/cache/uploads/{upload_id}/commit', headers=headers, json={"blocks": 1})
+    assert response.status_code == 200
+
+    response = client.get(f'/cache?version={version}', headers=headers)
+    assert response.data == b"shards"
+
+#-------------------Test cases for the async server -------------------
+
+def test_asgi_upload_and_download():
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    with TestClient(asgi_app) as client:
+        response = client.post('/data', headers=headers, files={'file': ('data.zip', TEST_FILE_CONTENT.encode(), 'text/plain')})
+        assert response.status_code == 200
+        version = response.json()["version"]
+
+        response = client.get('/data', headers=headers)
+        assert response.status_code == 200
+        assert response.text == TEST_FILE_CONTENT
+        assert response.headers['X-Artifact-Version'] == version
+
+        response = client.get('/data', headers={**headers, 'Range': 'bytes=5-8'})
+        assert response.status_code == 206
+        assert response.text == TEST_FILE_CONTENT[5:9]
+
+        etag = response.headers['ETag']
+        response = client.get('/data', headers={**headers, 'If-None-Match': f'"stale", {etag}'})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+
+def test_asgi_without_token():
+    with TestClient(asgi_app) as client:
+        assert client.get('/healthcheck').status_code == 200
+        response = client.get('/model')
+        assert response.status_code == 401
+        assert response.json() == {"error": "x-auth-request-user header is missing"}
+
+
+#-------------------Test cases for dataset deduplication -------------------
+
+def test_POST_data_is_content_addressed(client):
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    content = uuid.uuid4().bytes
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    response = client.post('/data', headers=headers, data={'file': (io.BytesIO(content), 'data.zip')})
+    assert response.json == {"status": "OK", "version": content_hash, "deduplicated": False}
+
+    response = client.post('/data', headers=headers, data={'file': (io.BytesIO(content), 'data.zip')})
+    assert response.json["deduplicated"]
+
+    response = client.get('/data', headers=headers)
+    assert response.data == content
+
+
+def test_POST_data_hash_only(client):
+    headers = {'x-auth-request-user': AUTH_TOKEN}
+    content = uuid.uuid4().bytes
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    # Unknown content has to be uploaded
+    response = client.post('/data', headers={**headers, 'X-Content-SHA256': content_hash})
+    assert response.status_code == 404
+
+    response = client.post('/data', headers={**headers, 'X-Content-SHA256': "0" * 64}, data={'file': (io.BytesIO(content), 'data.zip')})
+    assert response.status_code == 400
+
+    client.post('/data', headers=headers, data={'file': (io.BytesIO(content), 'data.zip')})
+    client.post('/data', headers=headers, data={'file': (io.BytesIO(b"other"), 'data.zip')})
+
+    # Known content only moves the latest version back to it
+    response = client.post('/data', headers={**headers, 'X-Content-SHA256': content_hash})
+    assert response.status_code == 200
+    assert response.json["deduplicated"]
+    assert client.get('/data', headers=headers).data == content
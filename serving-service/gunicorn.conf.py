@@ -0,0 +1,53 @@
+import os
+import math
+
+# Gunicorn configuration for the serving service. Every worker loads its own
+# copy of the model after the fork (no preload_app), and the TensorFlow thread
+# pools are sized so that all workers together use exactly the pod's CPUs.
+
+
+def _cpu_limit():
+    # cgroup v2
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+
+    return len(os.sched_getaffinity(0))
+
+
+cpus = _cpu_limit()
+
+wsgi_app = "main:create_app({})"
+bind = "0.0.0.0:" + os.getenv("SERVING_PORT", "5001")
+
+# Fewer workers with a larger intra-op pool each keeps the per-worker model
+# replicas (and their memory) down while still saturating the CPUs
+workers = int(os.getenv("WEB_CONCURRENCY", max(1, cpus // 2)))
+
+# Request threads mostly wait on the micro-batcher, they don't compete for CPU.
+# A worker only has as many requests in flight as threads, fewer than
+# MAX_BATCH_SIZE and no batch ever fills up, each one waits MAX_BATCH_WAIT_MS
+worker_class = "gthread"
+threads = int(os.getenv("SERVING_THREADS", os.getenv("MAX_BATCH_SIZE", "32")))
+
+# Model download and warm-up happen in the worker before it accepts requests
+timeout = int(os.getenv("SERVING_TIMEOUT", "300"))
+
+# Read by main.setup() in every worker
+os.environ.setdefault("TF_INTRA_OP_THREADS", str(max(1, cpus // workers)))
+os.environ.setdefault("TF_INTER_OP_THREADS", "1")
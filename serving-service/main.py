@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import requests
 from dotenv import load_dotenv
 import zipfile
@@ -6,18 +6,39 @@ import os
 import sys
 import io
 import json
+import base64
+import hashlib
+import tempfile
+import shutil
 import logging
+import queue
+import threading
+import time
 import numpy as np
 import tensorflow as tf
-from werkzeug.utils import secure_filename
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
 # Create a Flask app
 app = Flask(__name__)
 
+# Model downloads are streamed in chunks and only spill to disk above this size
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_SPOOL_SIZE = 32 * 1024 * 1024
+
 persistence_service_uri = None
 auth_header = None
-model = None
-config = None
+model_cache_dir = None
+model_version = None
+model_poll_interval = None
+model_watch_interval = None
+inference_backend = None
+servable = None
+reload_lock = threading.Lock()
+max_batch_size = None
+max_batch_wait_ms = None
+inference_timeout = None
+bulk_chunk_size = None
+default_top_k = None
 
 # ---------------------------------------------------------------------
 # -----------------------------functions-------------------------------
@@ -49,51 +70,446 @@ def setup():
     global auth_header
     auth_header = os.getenv("TENANT")
 
+    # Set model cache directory, mount a volume here to survive restarts
+    global model_cache_dir
+    model_cache_dir = os.path.abspath(os.getenv("MODEL_CACHE_DIR", "./model-cache"))
 
-def load_model():
+    # Set model version to serve, by default the latest one is served
+    global model_version
+    model_version = os.getenv("MODEL_VERSION")
+
+    # Set model polling interval in seconds, 0 disables polling
+    global model_poll_interval
+    model_poll_interval = float(os.getenv("MODEL_POLL_INTERVAL", "0"))
+
+    # Set how often a worker checks whether another worker reloaded the model
+    global model_watch_interval
+    model_watch_interval = float(os.getenv("MODEL_WATCH_INTERVAL", "1"))
+
+    # Set inference backend, "keras" or "tflite" for the quantized model
+    global inference_backend
+    inference_backend = os.getenv("INFERENCE_BACKEND", "keras")
+
+    # Size the TensorFlow thread pools, must happen before TensorFlow runs any op
+    try:
+        if os.getenv("TF_INTRA_OP_THREADS"):
+            intra_op_threads = int(os.getenv("TF_INTRA_OP_THREADS"))
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if os.getenv("TF_INTER_OP_THREADS"):
+            inter_op_threads = int(os.getenv("TF_INTER_OP_THREADS"))
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        logging.warning(f"Could not set TensorFlow thread pools: {str(e)}")
+
+    # Set micro-batching parameters
+    global max_batch_size, max_batch_wait_ms
+    max_batch_size = int(os.getenv("MAX_BATCH_SIZE", "32"))
+    max_batch_wait_ms = float(os.getenv("MAX_BATCH_WAIT_MS", "5"))
+
+    # Set how long a request waits for its result before giving up
+    global inference_timeout
+    inference_timeout = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+
+    # Set bulk inference parameters
+    global bulk_chunk_size, default_top_k
+    bulk_chunk_size = int(os.getenv("BULK_CHUNK_SIZE", "32"))
+    default_top_k = int(os.getenv("TOP_K", "3"))
+
+
+def _download_archive(response):
+    # Stream the body into a spooled temp file, hashing it on the way
+    archive = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE)
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    size = 0
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        archive.write(chunk)
+        md5.update(chunk)
+        sha256.update(chunk)
+        size += len(chunk)
+
+    # Verify size and checksum against what the persistence service announced
+    expected_size = response.headers.get("Content-Length")
+    if expected_size is not None and int(expected_size) != size:
+        raise ValueError(f"Model download incomplete: {size} of {expected_size} bytes")
+
+    expected_md5 = response.headers.get("Content-MD5")
+    if expected_md5 and base64.b64encode(md5.digest()).decode() != expected_md5:
+        raise ValueError("Model download checksum mismatch")
+
+    logging.info(f"Downloaded model archive ({size} bytes)")
+    archive.seek(0)
+    return archive, sha256.hexdigest()
+
+
+def _read_cache_entry():
+    # The cache entry records which extracted model is current and its ETag
+    try:
+        with open(os.path.join(model_cache_dir, "current.json"), "r") as json_file:
+            entry = json.load(json_file)
+        if os.path.isdir(os.path.join(model_cache_dir, entry["key"])):
+            return entry
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _write_cache_entry(entry):
+    # A unique temp file, all workers of the pod share the cache directory
+    fd, tmp_path = tempfile.mkstemp(prefix=".current-", dir=model_cache_dir)
+    with os.fdopen(fd, "w") as json_file:
+        json.dump(entry, json_file)
+    os.replace(tmp_path, os.path.join(model_cache_dir, "current.json"))
+
+
+def _extract_to_cache(archive, key):
+    extract_path = os.path.join(model_cache_dir, key)
+    if os.path.isdir(extract_path):
+        logging.info(f"Model {key} found in cache, skipping extraction")
+        return extract_path
+
+    # Extract next to the target and rename, so a half extracted model is never used
+    tmp_path = tempfile.mkdtemp(prefix=".extract-", dir=model_cache_dir)
+    with zipfile.ZipFile(archive, "r") as zip_ref:
+        zip_ref.extractall(tmp_path)
     try:
-        headers = {"x-auth-request-user": auth_header}
-        response = requests.get(persistence_service_uri+"/model", headers=headers, stream=True)
-        if response.status_code == 200:
-            # Use BytesIO for in-memory bytes buffer to store the zip content
-            zip_file_bytes = io.BytesIO(response.content)
-
-            # Extract the zip file contents
-            with zipfile.ZipFile(zip_file_bytes, "r") as zip_ref:
-                # Optionally specify a path where to extract
-                extract_path = "./model"
-                zip_ref.extractall(extract_path)
+        os.rename(tmp_path, extract_path)
+    except OSError:
+        # Another worker extracted the same model first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return extract_path
+
+
+def _prune_cache(keep):
+    for entry in os.listdir(model_cache_dir):
+        path = os.path.join(model_cache_dir, entry)
+        if os.path.isdir(path) and not entry.startswith(".") and entry not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def fetch_model():
+    # Returns the directory of the current model, only downloading it if changed
+    os.makedirs(model_cache_dir, exist_ok=True)
+    headers = {"x-auth-request-user": auth_header}
+    cached = _read_cache_entry()
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+
+    params = {"version": model_version} if model_version else {}
+    response = requests.get(
+        persistence_service_uri + "/model", headers=headers, params=params, stream=True
+    )
+    if response.status_code == 304:
+        logging.info(f"Model {cached['key']} unchanged, using cached copy")
+        return os.path.join(model_cache_dir, cached["key"])
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Unexpected response from persictence service: {str(response.status_code)}"
+        )
 
-            # Load the TensorFlow model
-            global model
-            model_directory = os.path.join(extract_path, "my_model.keras")
-            model = tf.keras.models.load_model(model_directory)
-
-            # Load the configuration JSON
-            config_path = os.path.join(extract_path, "config.json")
-            with open(config_path, "r") as json_file:
-                global config
-                config = json.load(json_file)
+    # The cache is keyed by content hash, so an unchanged model is not extracted twice
+    archive, key = _download_archive(response)
+    with archive:
+        model_path = _extract_to_cache(archive, key)
+    _write_cache_entry({"key": key, "etag": response.headers.get("ETag")})
+    logging.info(f"Fetched model version {response.headers.get('X-Artifact-Version')}")
+    _prune_cache(keep={key, cached["key"]} if cached else {key})
+    return model_path
+
+
+class MicroBatcher:
+    """Collects concurrent inference requests and runs them as a single model call.
+
+    A background worker takes the first queued image, then keeps collecting
+    until either max_batch_size images are queued or max_wait_ms has passed.
+    Every caller receives a Future resolving to its own row of the output.
+    """
+
+    def __init__(self, predict_fn, max_batch_size, max_wait_ms):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, image):
+        future = Future()
+        with self.lock:
+            if not self.closed:
+                self.queue.put((image, future))
+                return future
+
+        # The worker has stopped, e.g. a request that picked up this model just
+        # before a reload swapped it out, so run the image on its own
+        self._process([(image, future)])
+        return future
+
+    def close(self):
+        # Images submitted before close are still processed
+        with self.lock:
+            self.closed = True
+            self.queue.put(None)
+
+    def _collect(self):
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size and items[-1] is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        if items[-1] is None:
+            return items[:-1], True
+        return items, False
+
+    def _process(self, items):
+        try:
+            batch = np.concatenate([image for image, _ in items])
+            outputs = self.predict_fn(batch)
+            for i, (_, future) in enumerate(items):
+                # predict_fn may return several arrays, each caller gets its rows
+                if isinstance(outputs, tuple):
+                    future.set_result(tuple(output[i] for output in outputs))
+                else:
+                    future.set_result(outputs[i])
+        except Exception as e:
+            logging.error(f"Batched inference failed: {str(e)}")
+            for _, future in items:
+                future.set_exception(e)
+
+    def _run(self):
+        closed = False
+        while not closed:
+            items, closed = self._collect()
+            if items:
+                self._process(items)
+
+
+class Servable:
+    """A loaded model with its config, compiled predict function and batcher.
+
+    Requests take the current servable once and use it throughout, so a reload
+    swapping in a new one never mixes the preprocessing of one model with
+    the weights of another.
+    """
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+
+        # Load the configuration JSON
+        config_path = os.path.join(model_path, "config.json")
+        with open(config_path, "r") as json_file:
+            self.config = json.load(json_file)
+
+        # Batch sizes the model is warmed up for, the TFLite backend pads
+        # every batch to one of them: powers of two up to the largest batch
+        largest = max(max_batch_size, bulk_chunk_size)
+        self.batch_sizes = sorted(
+            {2**i for i in range(largest.bit_length()) if 2**i < largest} | {largest}
+        )
+
+        tflite_path = os.path.join(model_path, "model.tflite")
+        if inference_backend == "tflite" and os.path.exists(tflite_path):
+            self._log_quantization_report()
+            self.predict_fn = self._build_tflite_predict_fn(tflite_path)
         else:
-            logging.error(
-                f"Unexpected response from persictence service: {str(response.status_code)}"
+            if inference_backend == "tflite":
+                logging.warning("No TFLite model in archive, using the Keras model")
+
+            # Load the TensorFlow model
+            model_directory = os.path.join(model_path, "my_model.keras")
+            self.model = tf.keras.models.load_model(model_directory)
+            self.predict_fn = self._build_predict_fn()
+
+        self.batcher = MicroBatcher(self.rank, max_batch_size, max_batch_wait_ms)
+
+    def _build_predict_fn(self):
+        # Graph-mode forward pass with a fixed input signature, avoids the per-call
+        # tf.data and callback overhead of model.predict
+        input_signature = [
+            tf.TensorSpec(
+                shape=(None, self.config["height"], self.config["width"], 3),
+                dtype=tf.float32,
+            )
+        ]
+
+        @tf.function(input_signature=input_signature)
+        def predict(batch):
+            return self.model(batch, training=False)
+
+        return predict
+
+    def _build_tflite_predict_fn(self, tflite_path):
+        # Resizing an interpreter reallocates its tensors, far too slow per
+        # batch. Batches are padded to the next bucket size instead, and every
+        # bucket has its own interpreter, allocated once and used under a lock
+        # because interpreters are not thread-safe
+        num_threads = int(os.getenv("TF_INTRA_OP_THREADS", "0")) or None
+        shape = (self.config["height"], self.config["width"], 3)
+        interpreters = {}
+        for size in self.batch_sizes:
+            interpreter = tf.lite.Interpreter(
+                model_path=tflite_path, num_threads=num_threads
+            )
+            input_index = interpreter.get_input_details()[0]["index"]
+            output_index = interpreter.get_output_details()[0]["index"]
+            interpreter.resize_tensor_input(input_index, (size, *shape))
+            interpreter.allocate_tensors()
+            interpreters[size] = (
+                interpreter,
+                input_index,
+                output_index,
+                threading.Lock(),
+            )
+
+        def invoke(batch):
+            size = next(size for size in self.batch_sizes if size >= len(batch))
+            interpreter, input_index, output_index, lock = interpreters[size]
+            padding = np.zeros((size - len(batch), *shape), dtype=batch.dtype)
+            with lock:
+                interpreter.set_tensor(input_index, np.concatenate([batch, padding]))
+                interpreter.invoke()
+                return interpreter.get_tensor(output_index)[: len(batch)]
+
+        def predict(batch):
+            largest = self.batch_sizes[-1]
+            if len(batch) <= largest:
+                return invoke(batch)
+            return np.concatenate(
+                [invoke(batch[i : i + largest]) for i in range(0, len(batch), largest)]
             )
-            sys.exit(f"Unexpected response from persictence service")
 
+        return predict
+
+    def _log_quantization_report(self):
+        report_path = os.path.join(self.model_path, "quantization_report.json")
+        if os.path.exists(report_path):
+            with open(report_path, "r") as json_file:
+                report = json.load(json_file)
+            logging.info(f"Serving quantized model: {report}")
+
+    def warm_up(self):
+        # Trace the graph and run a few batches before serving the first request
+        for batch_size in self.batch_sizes:
+            batch = np.zeros(
+                (batch_size, self.config["height"], self.config["width"], 3),
+                dtype=np.float32,
+            )
+            self.predict_fn(batch)
+        logging.info("Model warm-up finished")
+
+    def predict(self, batch):
+        return np.asarray(self.predict_fn(batch.astype(np.float32, copy=False)))
+
+    def rank(self, batch):
+        # Probabilities of all classes, sorted, for the whole batch in one go
+        return _top_k(self.predict(batch), len(self.config["class_names"]))
+
+    def preprocess(self, image_bytes):
+        # Decode straight from memory, load_img accepts file-like objects
+        image = tf.keras.preprocessing.image.load_img(
+            io.BytesIO(image_bytes),
+            target_size=(self.config["height"], self.config["width"]),
+        )
+        return tf.keras.utils.img_to_array(image)
+
+    def close(self):
+        self.batcher.close()
+
+
+def _activate(new_servable):
+    # A single reference swap, in-flight requests keep the servable they started with
+    global servable
+    old_servable, servable = servable, new_servable
+    if old_servable is not None:
+        old_servable.close()
+
+
+def load_model():
+    try:
+        new_servable = Servable(fetch_model())
+        new_servable.warm_up()
+        _activate(new_servable)
     except Exception as e:
         logging.error(f"Unexpected error occurred: {str(e)}")
         sys.exit(f"Unexpected error occurred when loading model")
 
 
-def _inference(image):
+def _swap_in(model_path):
+    # Called under reload_lock, returns whether a new model was swapped in
+    if servable is not None and model_path == servable.model_path:
+        return False
+
+    new_servable = Servable(model_path)
+    new_servable.warm_up()
+    _activate(new_servable)
+    logging.info(f"Reloaded model {os.path.basename(model_path)}")
+    return True
+
+
+def reload_model():
+    # Load a changed model in the background of the running service, returns
+    # whether a new model was swapped in
+    with reload_lock:
+        return _swap_in(fetch_model())
+
+
+def follow_model():
+    # The cache entry is shared by all workers of the pod: when one of them
+    # reloaded the model, the others load the same extracted copy from disk
+    entry = _read_cache_entry()
+    if entry is None:
+        return False
+    with reload_lock:
+        return _swap_in(os.path.join(model_cache_dir, entry["key"]))
+
+
+def _poll_model():
+    while True:
+        time.sleep(model_poll_interval)
+        try:
+            reload_model()
+        except Exception as e:
+            logging.error(f"Model reload failed: {str(e)}")
+
+
+def _watch_model():
+    failed_key = None
+    while True:
+        time.sleep(model_watch_interval)
+        entry = _read_cache_entry()
+        if entry is None or entry["key"] == failed_key:
+            continue
+        try:
+            follow_model()
+        except Exception as e:
+            # Not retried until the entry moves on to another model
+            failed_key = entry["key"]
+            logging.error(f"Following model {failed_key} failed: {str(e)}")
+
+
+def start_model_poller():
+    if model_poll_interval > 0:
+        threading.Thread(target=_poll_model, daemon=True).start()
+    if model_watch_interval > 0:
+        threading.Thread(target=_watch_model, daemon=True).start()
+
+
+def _inference(current, image, k):
     try:
-        predictions = model.predict(image)
-        score = tf.nn.softmax(predictions[0])
-        return (
-            "This image most likely belongs to {} with a {:.2f} percent confidence.".format(
-                config["class_names"][np.argmax(score)], 100 * np.max(score)
-            )
-        ), 200
+        future = current.batcher.submit(np.asarray(image))
+        indices, scores = future.result(timeout=inference_timeout)
+        class_names = current.config["class_names"]
+        return jsonify(_format_result(class_names, indices[:k], scores[:k])), 200
+    except FutureTimeoutError:
+        logging.error(f"Inference did not finish within {inference_timeout}s")
+        return jsonify({"error": "Inference timed out"}), 504
     except Exception as e:
         logging.error(f"Unexpected error occurred: {str(e)}")
         return jsonify({"error": "An unexpected error occurred"}), 500
@@ -108,28 +524,125 @@ def _parse_and_infer(request):
         logging.error("Infer request has empty file")
         return jsonify({"error": "Infer request has empty file"}), 400
 
+    k = max(1, request.values.get("k", default=default_top_k, type=int))
+    current = servable
     try:
-        # Save file
-        filename = secure_filename(file.filename)
-        save_path = os.path.join("uploads", filename)
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        file.save(save_path)
+        img_array = current.preprocess(file.stream.read())
+        img_array = np.expand_dims(img_array, 0)  # Create a batch
+        return _inference(current, img_array, k)
+    except Exception as e:
+        logging.error(f"Error processing image: {str(e)}")
+        return jsonify({"error": "Error processing image"}), 500
 
-        # Load and preprocess image
-        image = tf.keras.preprocessing.image.load_img(
-            save_path, target_size=(config["height"], config["width"])
-        )
-        img_array = tf.keras.utils.img_to_array(image)
-        img_array = tf.expand_dims(img_array, 0)  # Create a batch
 
-        # Remove file
-        if os.path.exists(save_path):
-            os.remove(save_path)
+def _top_k(predictions, k):
+    # Softmax and top-k for the whole batch at once, vectorized over all rows
+    scores = np.exp(predictions - predictions.max(axis=1, keepdims=True))
+    scores /= scores.sum(axis=1, keepdims=True)
+    k = max(1, min(k, scores.shape[1]))
+    indices = np.argsort(-scores, axis=1)[:, :k]
+    return indices, np.take_along_axis(scores, indices, axis=1)
+
+
+def _format_result(class_names, indices, scores):
+    top_k = [
+        {"class": class_names[index], "confidence": float(score)}
+        for index, score in zip(indices, scores)
+    ]
+    return {
+        "class": top_k[0]["class"],
+        "confidence": top_k[0]["confidence"],
+        "top_k": top_k,
+    }
+
+
+def _detach_uploads(files):
+    # Flask closes the uploaded files when the view returns, before a streamed
+    # response is sent, so take over their streams and close them ourselves
+    uploads = [(file.filename, file.stream) for file in files]
+    for file in files:
+        file.stream = io.BytesIO()
+    return uploads
+
 
-        return _inference(img_array)
+def _iter_uploaded_images(uploads):
+    # A single zip archive is read member by member, anything else is an image
+    try:
+        if len(uploads) == 1 and zipfile.is_zipfile(uploads[0][1]):
+            uploads[0][1].seek(0)
+            with zipfile.ZipFile(uploads[0][1], "r") as zip_ref:
+                for member in zip_ref.infolist():
+                    if member.is_dir() or "__MACOSX" in member.filename:
+                        continue
+                    if ".DS_Store" in member.filename:
+                        continue
+                    yield member.filename, zip_ref.read(member)
+        else:
+            for filename, stream in uploads:
+                yield filename, stream.read()
+    finally:
+        for _, stream in uploads:
+            stream.close()
+
+
+def _infer_chunk(current, chunk, k):
+    try:
+        predictions = current.predict(np.stack([image for _, image in chunk]))
+        indices, scores = _top_k(predictions, k)
     except Exception as e:
-        logging.error(f"Error processing image: {str(e)}")
-        return jsonify({"error": "Error processing image"}), 500
+        logging.error(f"Unexpected error occurred: {str(e)}")
+        for filename, _ in chunk:
+            yield json.dumps({"filename": filename, "error": "Inference failed"}) + "\n"
+        return
+
+    class_names = current.config["class_names"]
+    for (filename, _), image_indices, image_scores in zip(chunk, indices, scores):
+        result = _format_result(class_names, image_indices, image_scores)
+        yield json.dumps({"filename": filename, **result}) + "\n"
+
+
+def _bulk_inference(current, images, k):
+    # Images are decoded lazily and sent through the model in fixed-size chunks,
+    # so only one chunk is held in memory at a time
+    chunk = []
+    for filename, image_bytes in images:
+        try:
+            chunk.append((filename, current.preprocess(image_bytes)))
+        except Exception as e:
+            logging.error(f"Error processing image {filename}: {str(e)}")
+            yield json.dumps(
+                {"filename": filename, "error": "Error processing image"}
+            ) + "\n"
+            continue
+
+        if len(chunk) == bulk_chunk_size:
+            yield from _infer_chunk(current, chunk, k)
+            chunk = []
+
+    if chunk:
+        yield from _infer_chunk(current, chunk, k)
+
+
+def _parse_and_infer_bulk(request):
+    files = [file for file in request.files.getlist("file") if file.filename != ""]
+    if not files:
+        logging.error("No file part in bulk infer request")
+        return jsonify({"error": "No file part"}), 400
+
+    k = request.values.get("k", default=default_top_k, type=int)
+    images = _iter_uploaded_images(_detach_uploads(files))
+    results = _bulk_inference(servable, images, k)
+    return Response(stream_with_context(results), mimetype="application/x-ndjson")
+
+
+def _reload():
+    try:
+        reloaded = reload_model()
+        model_id = os.path.basename(servable.model_path)
+        return jsonify({"status": "OK", "reloaded": reloaded, "model": model_id}), 200
+    except Exception as e:
+        logging.error(f"Model reload failed: {str(e)}")
+        return jsonify({"error": "Model reload failed"}), 500
 
 
 # ---------------------------------------------------------------------
@@ -142,6 +655,16 @@ def inference():
     return _parse_and_infer(request)
 
 
+@app.route("/infer/batch", methods=["POST"])
+def bulk_inference():
+    return _parse_and_infer_bulk(request)
+
+
+@app.route("/admin/reload", methods=["POST"])
+def reload():
+    return _reload()
+
+
 @app.route("/", methods=["GET"])
 def hello_world():
     return "Hello, World!"
@@ -150,6 +673,7 @@ def hello_world():
 def create_app(config):
     setup()
     load_model()
+    start_model_poller()
     app.config.from_object(config)
     return app
 
@@ -157,4 +681,5 @@ def create_app(config):
 if __name__ == "__main__":
     setup()
     load_model()
+    start_model_poller()
     app.run(host="0.0.0.0", port=5001, debug=True)
@@ -0,0 +1,248 @@
+import os
+import json
+import math
+import glob
+import shutil
+import logging
+import tarfile
+
+import requests
+import tensorflow as tf
+
+# Bump when the layout of the shards changes, older caches are ignored then
+CACHE_FORMAT = 2
+# Uncompressed size of one shard, enough shards to read them in parallel
+SHARD_SIZE = 128 * 1024 * 1024
+UPLOAD_BLOCK_SIZE = 8 * 1024 * 1024
+# Serialized records are handed to the shard writers in batches of this many
+WRITE_BATCH_SIZE = 256
+SPLITS = ("train", "val")
+
+
+def cache_key(dataset_version, config):
+    # A cache entry holds the resized images, so it depends on the dataset and
+    # the image size. Short enough for an upload id of the persistence service
+    return (
+        f"{dataset_version[:40]}-{config['height']}x{config['width']}"
+        f"-v{CACHE_FORMAT}"
+    )
+
+
+# ---------------------------------------------------------------------
+# ------------------------------shards---------------------------------
+# ---------------------------------------------------------------------
+
+
+def _serialize(image, label):
+    # Images are stored resized as uint8, a quarter of the float32 size. Only
+    # graph ops, so the records are built in parallel inside the input pipeline
+    image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    label = tf.cast(label, tf.int64)
+    return tf.io.serialize_tensor(
+        tf.stack([tf.io.serialize_tensor(image), tf.io.serialize_tensor(label)])
+    )
+
+
+def write_shards(datasets, class_names, config, cache_dir):
+    """Writes the (image, label) datasets as sharded TFRecord files.
+
+    datasets maps the split names to unbatched datasets, every split is
+    spread round robin over enough shards of about SHARD_SIZE bytes.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    image_size = config["height"] * config["width"] * 3
+    counts = {}
+    for split, ds in datasets.items():
+        num_images = int(ds.cardinality())
+        num_shards = max(1, math.ceil(num_images * image_size / SHARD_SIZE))
+        writers = [
+            tf.io.TFRecordWriter(
+                os.path.join(
+                    cache_dir, f"{split}-{index:05d}-of-{num_shards:05d}.tfrecord"
+                )
+            )
+            for index in range(num_shards)
+        ]
+        records = ds.map(_serialize, num_parallel_calls=tf.data.AUTOTUNE)
+        records = records.batch(WRITE_BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+        counts[split] = 0
+        try:
+            # A single pass over the decoded images, only the finished records
+            # are dealt out to the shards
+            for batch in records.as_numpy_iterator():
+                for record in batch:
+                    writers[counts[split] % num_shards].write(record)
+                    counts[split] += 1
+        finally:
+            for writer in writers:
+                writer.close()
+
+    # The index is written last, a cache without one is incomplete
+    with open(os.path.join(cache_dir, "index.json"), "w") as index_file:
+        json.dump(
+            {
+                "format": CACHE_FORMAT,
+                "height": config["height"],
+                "width": config["width"],
+                "class_names": class_names,
+                "counts": counts,
+            },
+            index_file,
+        )
+
+
+def read_shards(cache_dir):
+    """Returns the cached datasets by split name and the class names."""
+    AUTOTUNE = tf.data.AUTOTUNE
+    with open(os.path.join(cache_dir, "index.json")) as index_file:
+        index = json.load(index_file)
+    shape = (index["height"], index["width"], 3)
+
+    def parse(record):
+        parts = tf.io.parse_tensor(record, tf.string)
+        image = tf.ensure_shape(tf.io.parse_tensor(parts[0], tf.uint8), shape)
+        label = tf.ensure_shape(tf.io.parse_tensor(parts[1], tf.int64), [])
+        return tf.cast(image, tf.float32), tf.cast(label, tf.int32)
+
+    datasets = {}
+    for split in SPLITS:
+        files = sorted(glob.glob(os.path.join(cache_dir, f"{split}-*.tfrecord")))
+        ds = tf.data.TFRecordDataset(files, num_parallel_reads=AUTOTUNE)
+        ds = ds.map(parse, num_parallel_calls=AUTOTUNE)
+        # The number of images is known, keras can show the progress of an epoch
+        datasets[split] = ds.apply(
+            tf.data.experimental.assert_cardinality(index["counts"][split])
+        )
+    return datasets, index["class_names"]
+
+
+# ---------------------------------------------------------------------
+# ---------------------------persistence-------------------------------
+# ---------------------------------------------------------------------
+
+
+def download_cache(persistence_url, tenant, key, cache_dir):
+    """Fetches and unpacks the cache entry, returns False if there is none.
+
+    The entry is a tar stream, the shards are extracted while they arrive
+    without a copy of the whole archive on disk.
+    """
+    with requests.get(
+        f"{persistence_url}/cache",
+        params={"version": key},
+        headers={"x-auth-request-user": tenant},
+        stream=True,
+    ) as response:
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        response.raw.decode_content = True
+        with tarfile.open(fileobj=response.raw, mode="r|") as archive:
+            archive.extractall(cache_dir, filter="data")
+    return True
+
+
+class _BlockUpload:
+    """A write-only file that sends its content as the blocks of a chunked upload."""
+
+    def __init__(self, url, headers):
+        self.url = url
+        self.headers = headers
+        self.buffer = bytearray()
+        self.blocks = 0
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= UPLOAD_BLOCK_SIZE:
+            self._send(bytes(self.buffer[:UPLOAD_BLOCK_SIZE]))
+            del self.buffer[:UPLOAD_BLOCK_SIZE]
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self._send(bytes(self.buffer))
+            self.buffer.clear()
+
+    def _send(self, block):
+        response = requests.put(
+            f"{self.url}/blocks/{self.blocks}", headers=self.headers, data=block
+        )
+        response.raise_for_status()
+        self.blocks += 1
+
+
+def upload_cache(persistence_url, tenant, key, cache_dir):
+    # The shards are already compact and split, they are streamed as an
+    # uncompressed tar straight into the blocks of a chunked upload, so the
+    # archive is neither held in memory nor written to disk
+    headers = {"x-auth-request-user": tenant}
+    response = requests.post(
+        f"{persistence_url}/cache/uploads", headers=headers, json={"version": key}
+    )
+    response.raise_for_status()
+    upload_id = response.json()["upload_id"]
+
+    upload = _BlockUpload(f"{persistence_url}/cache/uploads/{upload_id}", headers)
+    with tarfile.open(fileobj=upload, mode="w|") as archive:
+        for name in sorted(os.listdir(cache_dir)):
+            archive.add(os.path.join(cache_dir, name), arcname=name)
+    upload.flush()
+
+    response = requests.post(
+        f"{persistence_url}/cache/uploads/{upload_id}/commit",
+        headers=headers,
+        json={"blocks": upload.blocks, "content_type": "application/x-tar"},
+    )
+    # A concurrent training of the same dataset stored it first
+    if response.status_code != 409:
+        response.raise_for_status()
+
+
+def load_cached_datasets(persistence_url, tenant, dataset_version, config, cache_dir):
+    """Returns the preprocessed datasets of an earlier training, None if missing."""
+    key = cache_key(dataset_version, config)
+    try:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        if not download_cache(persistence_url, tenant, key, cache_dir):
+            logging.info(f"No preprocessed dataset {key} stored yet")
+            return None
+        datasets, class_names = read_shards(cache_dir)
+    except Exception as e:
+        logging.error(f"Loading the preprocessed dataset failed: {str(e)}")
+        return None
+
+    logging.info(f"Using the preprocessed dataset {key}")
+    return datasets["train"], datasets["val"], class_names
+
+
+def cache_datasets(
+    persistence_url,
+    tenant,
+    dataset_version,
+    train_ds,
+    val_ds,
+    class_names,
+    config,
+    cache_dir,
+):
+    """Preprocesses the datasets into shards and stores them for later trainings.
+
+    Returns the datasets read back from the local shards, so the images are
+    decoded once for this training as well. Falls back to the given datasets
+    if preprocessing fails.
+    """
+    key = cache_key(dataset_version, config)
+    try:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        write_shards({"train": train_ds, "val": val_ds}, class_names, config, cache_dir)
+        datasets, _ = read_shards(cache_dir)
+    except Exception as e:
+        logging.error(f"Preprocessing the dataset failed: {str(e)}")
+        return train_ds, val_ds
+
+    try:
+        upload_cache(persistence_url, tenant, key, cache_dir)
+        logging.info(f"Stored the preprocessed dataset {key}")
+    except Exception as e:
+        logging.error(f"Storing the preprocessed dataset failed: {str(e)}")
+    return datasets["train"], datasets["val"]
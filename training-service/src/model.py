@@ -1,39 +1,122 @@
 import os
+import glob
+import logging
 
+import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from keras import layers
 from keras.models import Sequential
 
+from validation import ZipReader
 
-def create_datasets(data_dir, config, seed):
-    train_ds, val_ds = keras.utils.image_dataset_from_directory(
-        data_dir,
-        validation_split=0.2,
-        subset="both",
-        seed=seed,
-        image_size=(config["height"], config["width"]),
-        batch_size=config["batch_size"],
-    )
+CACHE_POLICIES = ("auto", "memory", "disk", "none")
+# Share of the pod's memory the in-memory cache may take with CACHE_POLICY=auto,
+# the rest is left to the model, the shuffle buffer and the prefetched batches
+MEMORY_CACHE_FRACTION = 0.5
 
-    return train_ds, val_ds
+
+def decode_datasets(zip_path, manifest, config, seed, validation_split=0.2):
+    """Decodes the training and validation images straight from the archive.
+
+    The images listed in the manifest are read from the zip and decoded
+    inside a parallel tf.data map, nothing is extracted to disk. Like
+    keras.utils.image_dataset_from_directory the class names are the sorted
+    class directories and the split is taken from the shuffled file list.
+    Returns unbatched (image, label) datasets and the class names.
+    """
+    AUTOTUNE = tf.data.AUTOTUNE
+    reader = ZipReader(zip_path)
+
+    class_names = sorted({label for _, label in manifest})
+    class_indices = {name: index for index, name in enumerate(class_names)}
+    names = np.array([name for name, _ in manifest])
+    labels = np.array([class_indices[label] for _, label in manifest], np.int32)
+
+    order = np.random.RandomState(seed).permutation(len(names))
+    num_val = int(validation_split * len(names))
+    train_idx, val_idx = order[: len(names) - num_val], order[len(names) - num_val :]
+
+    def read_member(name):
+        return reader.read(name.decode())
+
+    def load_image(name, label):
+        data = tf.numpy_function(read_member, [name], tf.string, stateful=False)
+        image = tf.io.decode_image(data, channels=3, expand_animations=False)
+        image = tf.image.resize(image, (config["height"], config["width"]))
+        image.set_shape((config["height"], config["width"], 3))
+        return image, label
+
+    def build(indices):
+        ds = tf.data.Dataset.from_tensor_slices((names[indices], labels[indices]))
+        return ds.map(load_image, num_parallel_calls=AUTOTUNE)
+
+    return build(train_idx), build(val_idx), class_names
 
 
-def create_model(data_dir, train_ds, val_ds, config):
+def memory_limit():
+    # Memory limit of the pod (cgroup v2, then v1), otherwise the physical memory
+    for path in (
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    ):
+        try:
+            with open(path) as f:
+                limit = f.read().strip()
+            # cgroup v1 reports an unlimited group as a huge number
+            if limit != "max" and int(limit) < 2**60:
+                return int(limit)
+        except (OSError, ValueError):
+            pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def cache_policy(num_images, config):
+    if config["cache_policy"] != "auto":
+        return config["cache_policy"]
+
+    # Decoded images are float32, keep them in memory only if they fit easily
+    decoded_size = num_images * config["height"] * config["width"] * 3 * 4
+    limit = memory_limit()
+    policy = "memory" if decoded_size <= MEMORY_CACHE_FRACTION * limit else "disk"
+    logging.info(
+        f"Decoded dataset needs about {decoded_size / 2**20:.0f} MiB, memory limit "
+        f"is {limit / 2**20:.0f} MiB: caching on {policy}"
+    )
+    return policy
+
+
+def batch_datasets(train_ds, val_ds, config, seed):
     AUTOTUNE = tf.data.AUTOTUNE
+    num_images = int(train_ds.cardinality()) + int(val_ds.cardinality())
+    policy = cache_policy(num_images, config)
 
-    # Cache and prefetch the datasets
+    def cache(ds, name):
+        if policy == "memory":
+            return ds.cache()
+        if policy == "disk":
+            # Cache files of an earlier training would be reused as they are
+            filename = os.path.join(config["cache_dir"], name)
+            os.makedirs(config["cache_dir"], exist_ok=True)
+            for path in glob.glob(f"{filename}.*"):
+                os.remove(path)
+            return ds.cache(filename)
+        return ds
+
+    # Cache, shuffle and prefetch the datasets
     train_ds = (
-        train_ds.cache().shuffle(config["batch_size"]).prefetch(buffer_size=AUTOTUNE)
+        cache(train_ds, "train")
+        .shuffle(config["batch_size"], seed=seed)
+        .batch(config["batch_size"])
+        .prefetch(buffer_size=AUTOTUNE)
+    )
+    val_ds = (
+        cache(val_ds, "val").batch(config["batch_size"]).prefetch(buffer_size=AUTOTUNE)
     )
-    val_ds = val_ds.cache().prefetch(buffer_size=AUTOTUNE)
-
-    # define class names (work around if train_ds.class_names is undefined)
-    class_names = [
-        item
-        for item in os.listdir(data_dir)
-        if os.path.isdir(os.path.join(data_dir, item))
-    ]
+    return train_ds, val_ds
+
+
+def create_model(class_names, config):
     # set up data augmentation
     data_augmentation = keras.Sequential(
         [
@@ -70,7 +153,7 @@ def create_model(data_dir, train_ds, val_ds, config):
         metrics=["accuracy"],
     )
 
-    return model, class_names
+    return model
 
 
 def train_model(model, train_ds, val_ds, epochs=20):
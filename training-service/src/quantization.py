@@ -0,0 +1,65 @@
+import logging
+import os
+
+import numpy as np
+import tensorflow as tf
+
+
+def convert_to_tflite(model, train_ds, mode, calibration_steps=10):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    # Without a representative dataset the converter quantizes weights only
+    # (dynamic range), with one it also calibrates int8 activations
+    if mode == "int8":
+
+        def representative_dataset():
+            for images, _ in train_ds.take(calibration_steps):
+                for image in images:
+                    yield [tf.cast(image[tf.newaxis], tf.float32)]
+
+        converter.representative_dataset = representative_dataset
+
+    return converter.convert()
+
+
+def _tflite_predict(tflite_model, images):
+    interpreter = tf.lite.Interpreter(model_content=tflite_model)
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+    interpreter.resize_tensor_input(input_index, images.shape)
+    interpreter.allocate_tensors()
+    interpreter.set_tensor(input_index, images.astype(np.float32))
+    interpreter.invoke()
+    return interpreter.get_tensor(output_index)
+
+
+def evaluate_quantization(model, tflite_model, val_ds, model_path):
+    # Compare the predictions of the float and the quantized model on the
+    # validation set, so the accuracy cost of quantization is known
+    correct_keras = 0
+    correct_tflite = 0
+    agreement = 0
+    total = 0
+    for images, labels in val_ds:
+        images = images.numpy()
+        labels = labels.numpy()
+        keras_classes = np.argmax(model(images, training=False), axis=1)
+        tflite_classes = np.argmax(_tflite_predict(tflite_model, images), axis=1)
+        correct_keras += int(np.sum(keras_classes == labels))
+        correct_tflite += int(np.sum(tflite_classes == labels))
+        agreement += int(np.sum(keras_classes == tflite_classes))
+        total += len(labels)
+
+    total = max(total, 1)
+    report = {
+        "keras_accuracy": correct_keras / total,
+        "tflite_accuracy": correct_tflite / total,
+        "accuracy_delta": (correct_tflite - correct_keras) / total,
+        "prediction_agreement": agreement / total,
+        "num_samples": total,
+        "keras_size_bytes": os.path.getsize(model_path),
+        "tflite_size_bytes": len(tflite_model),
+    }
+    logging.info(f"Quantization report: {report}")
+    return report
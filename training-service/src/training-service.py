@@ -1,88 +1,113 @@
 import os
 import json
-import shutil
 import sys
 import zipfile
-import imghdr
 import requests
 import logging
 
 from io import BytesIO
-from pathlib import Path
 from dotenv import load_dotenv
-from model import create_datasets, create_model, train_model
+from dataset_cache import cache_datasets, load_cached_datasets
+from model import (
+    CACHE_POLICIES,
+    batch_datasets,
+    create_model,
+    decode_datasets,
+    train_model,
+)
+from quantization import convert_to_tflite, evaluate_quantization
+from validation import validate_dataset, write_manifest
 
 # Define the required environment variables
 REQUIRED_ENV_VARS = ["PERSISTENCE_SERVICE_URI", "TENANT"]
-OPTINAL_ENV_VARS = ["IMG_HEIGHT", "IMG_WIDTH", "BATCH_SIZE", "EPOCHS"]
+OPTINAL_ENV_VARS = [
+    "IMG_HEIGHT",
+    "IMG_WIDTH",
+    "BATCH_SIZE",
+    "EPOCHS",
+    "QUANTIZATION",
+    "VALIDATION_DECODE",
+    "VALIDATION_WORKERS",
+    "CACHE_POLICY",
+    "CACHE_DIR",
+]
 
 # Define global variables
 seed = 42
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 # ---------------------------------------------------------------------
 # -----------------------------functions-------------------------------
 # ---------------------------------------------------------------------
 
 
-def clean_data(data_dir):
-    image_extensions = [".png", ".jpg"]
-    img_type_accepted_by_tf = ["bmp", "gif", "jpeg", "png"]
-
-    cnt_removed = 0
-    for filepath in Path(data_dir).rglob("*"):
-        # MACOS specific requierements
-        if filepath.is_dir() and "__MACOSX" in filepath.name:
-            logging.info(f"Found and removed __MACOSX artefact")
-            shutil.rmtree(filepath)
-            continue
-
-        if ".DS_Store" in filepath.name:
-            logging.info(f"Found and removed .DS_Store artefact")
-            os.remove(filepath)
-            continue
-
-        if filepath.suffix.lower() in image_extensions:
-            img_type = imghdr.what(filepath)
-            if img_type is None or img_type not in img_type_accepted_by_tf:
-                os.remove(filepath)
-                cnt_removed += 1
-
-    logging.info(f"Found and removed {cnt_removed} invalid files")
+def clean_data(zip_path, config):
+    # Check the images in parallel and leave out the ones TensorFlow cannot read
+    manifest, summary = validate_dataset(
+        zip_path, config["validation_decode"], config["validation_workers"]
+    )
+    write_manifest(manifest, "./manifest.csv")
+    with open("./validation_report.json", "w") as report_file:
+        json.dump(summary, report_file)
+
+    logging.info(
+        f"Validated {summary['images']} images with {summary['workers']} workers "
+        f"in {summary['duration_s']}s: {summary['valid']} valid, "
+        f"removed {summary['removed']}, skipped {summary['skipped']}"
+    )
+    return manifest
 
 
-def fetch_data(persistence_url, tenant, extract_path):
+def get_data_version(persistence_url, tenant):
+    # The latest dataset version, the sha256 of the uploaded zip. None for data
+    # uploaded before versioning
     try:
         response = requests.get(
-            f"{persistence_url}/data", headers={"x-auth-request-user": tenant}, stream=True
+            f"{persistence_url}/data/versions", headers={"x-auth-request-user": tenant}
         )
-        print(response.status_code, persistence_url, tenant)
-        if response.status_code == 200:
-            # Use BytesIO for in-memory bytes buffer to store the zip content
-            zip_file_bytes = BytesIO(response.content)
+        response.raise_for_status()
+        return response.json()["latest"]
+    except Exception as e:
+        logging.error(f"Looking up the dataset version failed: {str(e)}")
+        return None
 
-            # Extract the zip file contents
-            with zipfile.ZipFile(zip_file_bytes, "r") as zip_ref:
-                zip_ref.extractall(extract_path)
 
-            # Load the TensorFlow model
-            clean_data(extract_path)
-        else:
-            logging.error(
-                f"Unexpected response from persictence service: {str(response.status_code)}"
-            )
-            sys.exit(f"Unexpected response from persictence service")
+def fetch_data(persistence_url, tenant, zip_path, version=None):
+    try:
+        with requests.get(
+            f"{persistence_url}/data",
+            headers={"x-auth-request-user": tenant},
+            params={"version": version} if version else {},
+            stream=True,
+        ) as response:
+            print(response.status_code, persistence_url, tenant)
+            if response.status_code != 200:
+                logging.error(
+                    f"Unexpected response from persictence service: {str(response.status_code)}"
+                )
+                sys.exit(f"Unexpected response from persictence service")
+
+            # Stream the zip file to disk instead of holding it in memory, the
+            # datasets read the images straight from the archive
+            with open(zip_path, "wb") as zip_file:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    zip_file.write(chunk)
     except Exception as e:
         logging.error(f"Unexpected error occurred: {str(e)}")
         sys.exit(f"Unexpected error occurred when loading model")
 
 
-def transmit_data(persistence_url, tenant, config, model_path):
+def transmit_data(persistence_url, tenant, config, model_path, extra_files=()):
     try: 
         zip_buffer = BytesIO()
         with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
             # Add model file to zip
             zip_file.write(model_path, arcname=os.path.basename(model_path))
 
+            # Add optional artefacts like the quantized model
+            for file_path in extra_files:
+                zip_file.write(file_path, arcname=os.path.basename(file_path))
+
             # Serialize config dictionary to JSON and write directly to the zip
             with zip_file.open("config.json", "w") as config_file:
                 config_file.write(json.dumps(config).encode("utf-8"))
@@ -96,7 +121,11 @@ def transmit_data(persistence_url, tenant, config, model_path):
         # Prepare the files dictionary to send via requests
         files = {"file": (zip_filename, zip_buffer, "application/zip")}
 
-        response = requests.post(f"{persistence_url}/model", headers={"x-auth-request-user": tenant}, files=files,)
+        # The model is stored under the id of this training job, a concurrent
+        # training of the same tenant gets its own version
+        data = {"version": config["version"]} if config["version"] else {}
+
+        response = requests.post(f"{persistence_url}/model", headers={"x-auth-request-user": tenant}, files=files, data=data,)
 
         if response.status_code == 200:
             logging.info("File transmitted successfully")
@@ -123,19 +152,43 @@ def setup():
         "width": 180,
         "batch_size": 128,
         "epochs": 10,
+        "quantization": "dynamic",
+        "version": os.getenv("UUID"),
+        "validation_decode": False,
+        "validation_workers": 0,
+        "cache_policy": "auto",
+        "cache_dir": os.path.abspath("./tf_cache"),
     }
 
-    for var in REQUIRED_ENV_VARS:
+    for var in OPTINAL_ENV_VARS:
         if var in os.environ:
             logging.info(f"Environment variable {var} is set")
             if var == "IMG_HEIGHT":
-                config["height"] = os.getenv(int(var))
+                config["height"] = int(os.getenv(var))
             elif var == "IMG_WIDTH":
-                config["width"] = os.getenv(int(var))
+                config["width"] = int(os.getenv(var))
             elif var == "BATCH_SIZE":
-                config["batch_size"] = os.getenv(int(var))
+                config["batch_size"] = int(os.getenv(var))
             elif var == "EPOCHS":
-                config["epochs"] = os.getenv(int(var))
+                config["epochs"] = int(os.getenv(var))
+            elif var == "QUANTIZATION":
+                config["quantization"] = os.getenv(var)
+            elif var == "VALIDATION_DECODE":
+                config["validation_decode"] = os.getenv(var).lower() in (
+                    "1",
+                    "true",
+                    "yes",
+                )
+            elif var == "VALIDATION_WORKERS":
+                config["validation_workers"] = int(os.getenv(var))
+            elif var == "CACHE_POLICY":
+                config["cache_policy"] = os.getenv(var).lower()
+            elif var == "CACHE_DIR":
+                config["cache_dir"] = os.path.abspath(os.getenv(var))
+
+    if config["cache_policy"] not in CACHE_POLICIES:
+        logging.error(f"Error: CACHE_POLICY must be one of {', '.join(CACHE_POLICIES)}")
+        sys.exit(f"Error: CACHE_POLICY must be one of {', '.join(CACHE_POLICIES)}")
 
     return persistence_service_uri, tenant, config
 
@@ -158,21 +211,67 @@ def main():
 
     # define variables
     persistence_service_uri, tenant, config = setup()
-    data_dir = os.path.abspath("./data")
+    data_zip = os.path.abspath("./data.zip")
+    cache_dir = os.path.abspath("./preprocessed")
+
+    # use the images preprocessed by an earlier training of the same dataset
+    data_version = get_data_version(persistence_service_uri, tenant)
+    datasets = None
+    if data_version:
+        datasets = load_cached_datasets(
+            persistence_service_uri, tenant, data_version, config, cache_dir
+        )
 
-    # fetch data
-    fetch_data(persistence_service_uri, tenant, data_dir)
+    # otherwise fetch, validate and preprocess the data
+    if datasets is not None:
+        train_ds, val_ds, class_names = datasets
+    else:
+        fetch_data(persistence_service_uri, tenant, data_zip, data_version)
+        manifest = clean_data(data_zip, config)
+        train_ds, val_ds, class_names = decode_datasets(
+            data_zip, manifest, config, seed
+        )
+        if data_version:
+            train_ds, val_ds = cache_datasets(
+                persistence_service_uri,
+                tenant,
+                data_version,
+                train_ds,
+                val_ds,
+                class_names,
+                config,
+                cache_dir,
+            )
 
     # train model
-    train_ds, val_ds = create_datasets(data_dir, config, seed)
-    model, class_names = create_model(data_dir, train_ds, val_ds, config)
+    train_ds, val_ds = batch_datasets(train_ds, val_ds, config, seed)
+    model = create_model(class_names, config)
     _ = train_model(model, train_ds, val_ds, config["epochs"])
     model.save("./my_model.keras")
 
     config["class_names"] = class_names
 
+    # quantize model for the TFLite serving backend ("none", "dynamic" or "int8")
+    extra_files = []
+    if config["quantization"] != "none":
+        try:
+            tflite_model = convert_to_tflite(model, train_ds, config["quantization"])
+            with open("./model.tflite", "wb") as tflite_file:
+                tflite_file.write(tflite_model)
+            report = evaluate_quantization(
+                model, tflite_model, val_ds, "./my_model.keras"
+            )
+            report["mode"] = config["quantization"]
+            with open("./quantization_report.json", "w") as report_file:
+                json.dump(report, report_file)
+            extra_files = ["./model.tflite", "./quantization_report.json"]
+        except Exception as e:
+            logging.error(f"Quantization failed, only the Keras model is sent: {str(e)}")
+
     # transmit model
-    transmit_data(persistence_service_uri, tenant, config, "./my_model.keras")
+    transmit_data(
+        persistence_service_uri, tenant, config, "./my_model.keras", extra_files
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import os
+import csv
+import time
+import threading
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import tensorflow as tf
+
+# Extensions picked up by keras.utils.image_dataset_from_directory
+IMAGE_EXTENSIONS = (".bmp", ".gif", ".jpeg", ".jpg", ".png")
+
+# Leading bytes of the image formats TensorFlow can decode
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+]
+HEADER_SIZE = 8
+
+
+def image_type(header):
+    for signature, img_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return img_type
+    return None
+
+
+def cpu_limit():
+    # CPU limit of the pod (cgroup v2, then v1), otherwise the usable cores
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+            if quota != "max":
+                return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+def is_artefact(name):
+    parts = name.split("/")
+    return "__MACOSX" in parts or parts[-1] == ".DS_Store"
+
+
+class ZipReader:
+    """Reads members of a zip archive with one open handle per thread.
+
+    A ZipFile shares a single file position between its members, so threads
+    reading in parallel each need their own handle.
+    """
+
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self.local = threading.local()
+
+    def _zip_file(self):
+        if not hasattr(self.local, "zip_file"):
+            self.local.zip_file = zipfile.ZipFile(self.zip_path, "r")
+        return self.local.zip_file
+
+    def read(self, name, size=-1):
+        with self._zip_file().open(name) as member:
+            return member.read(size)
+
+
+def _check_image(reader, name, decode):
+    # Returns the reason the image is invalid, None if it is valid
+    try:
+        data = reader.read(name, -1 if decode else HEADER_SIZE)
+    except (OSError, zipfile.BadZipFile):
+        return "unreadable"
+    if image_type(data[:HEADER_SIZE]) is None:
+        return "unknown format"
+
+    if decode:
+        # TensorFlow releases the GIL while decoding, so threads decode in parallel
+        try:
+            tf.io.decode_image(data, channels=3, expand_animations=False)
+        except (tf.errors.OpError, ValueError):
+            return "not decodable"
+    return None
+
+
+def validate_dataset(zip_path, decode=False, workers=0):
+    """Checks all images of the dataset archive in parallel.
+
+    The archive's central directory is indexed once, then every image
+    member's header is checked against the formats TensorFlow decodes, with
+    decode=True it is fully decoded as well. Returns the manifest of valid
+    images as (member name, label) pairs, the label being the class
+    directory, and a summary report.
+    """
+    workers = workers or cpu_limit()
+    reader = ZipReader(zip_path)
+    start = time.monotonic()
+
+    images = []
+    skipped = Counter()
+    with zipfile.ZipFile(zip_path, "r") as zip_file:
+        for member in zip_file.infolist():
+            if member.is_dir():
+                continue
+            if is_artefact(member.filename):
+                skipped["artefacts"] += 1
+            elif not member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                skipped["other files"] += 1
+            # Only images in a class directory are used for training
+            elif "/" not in member.filename:
+                skipped["unlabeled"] += 1
+            else:
+                images.append(member.filename)
+
+    def check(name):
+        return name, _check_image(reader, name, decode)
+
+    manifest = []
+    class_counts = Counter()
+    removed = Counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, reason in pool.map(check, images):
+            if reason is not None:
+                removed[reason] += 1
+                continue
+            label = name.split("/", 1)[0]
+            manifest.append((name, label))
+            class_counts[label] += 1
+
+    manifest.sort()
+    summary = {
+        "images": len(images),
+        "valid": len(manifest),
+        "removed": dict(removed),
+        "skipped": dict(skipped),
+        "classes": dict(sorted(class_counts.items())),
+        "decoded": decode,
+        "workers": workers,
+        "duration_s": round(time.monotonic() - start, 3),
+    }
+    return manifest, summary
+
+
+def write_manifest(manifest, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["path", "label"])
+        writer.writerows(manifest)